@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""
+An on-disk cache of pairwise alignments made with sequence_aligner.py.
+
+Alignments are stored as small text files in a cache directory, keyed by a
+hash of the two sequences, the scoring parameters and the backend, so the
+same PDB chain and UniProt sequence are aligned only once however many
+entries and runs they come up in. Entries are written to a temporary file
+and renamed, so concurrent runs never see a partial entry. The cache is
+bounded in size; the least recently used entries are evicted first, see
+disk_cache.py.
+
+The cache directory defaults to ~/.cache/script_repo/alignments and can be
+changed with the ALIGNMENT_CACHE_DIR environment variable; setting it to an
+empty string turns caching off. ALIGNMENT_CACHE_MAX_MB bounds the size of
+the cache (default 256).
+"""
+
+# imports from the standard library
+import hashlib
+import os
+import tempfile
+from argparse import ArgumentParser
+# imports from this repository
+import sequence_aligner
+from disk_cache import added, evict
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'script_repo', 'alignments')
+
+
+def get_cache_dir():
+    """
+    The cache directory, None if caching is turned off.
+    """
+    cache_dir = os.environ.get('ALIGNMENT_CACHE_DIR', DEFAULT_CACHE_DIR)
+    return cache_dir or None
+
+
+def get_max_bytes():
+    """
+    Size bound of the cache in bytes.
+    """
+    return int(float(os.environ.get('ALIGNMENT_CACHE_MAX_MB', 256)) * 2**20)
+
+
+def cache_key(seq_a, seq_b, backend=sequence_aligner.DEFAULT_BACKEND):
+    """
+    Key of the cache entry for aligning seq_a with seq_b, a hex digest.
+    """
+    digest = hashlib.sha1()
+    parameters = (sequence_aligner.MATCH_SCORE, sequence_aligner.MISMATCH_SCORE,
+                  sequence_aligner.GAP_OPEN_SCORE,
+                  sequence_aligner.GAP_EXTEND_SCORE, backend)
+    digest.update(repr(parameters).encode())
+    for seq in (seq_a, seq_b):
+        digest.update(b'\0' + str(seq).encode())
+    return digest.hexdigest()
+
+
+def align(seq_a, seq_b, backend=sequence_aligner.DEFAULT_BACKEND,
+          cache_dir=None, max_bytes=None):
+    """
+    A global alignment of two sequences, from the cache if it is there,
+    otherwise made with sequence_aligner.global_align and added to the
+    cache.
+
+    Parameters
+    ----------
+    seq_a, seq_b : str
+        The sequences.
+    backend : str
+        Alignment backend, see sequence_aligner.BACKENDS.
+    cache_dir : str
+        Cache directory, defaults to get_cache_dir().
+    max_bytes : int
+        Size bound of the cache, defaults to get_max_bytes().
+
+    Returns
+    -------
+    tuple
+        The two aligned sequences, with '-' for gaps, and the score.
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return sequence_aligner.global_align(seq_a, seq_b, backend)
+
+    entry = os.path.join(cache_dir, cache_key(seq_a, seq_b, backend) + '.aln')
+    try:
+        with open(entry, 'rt') as ipf:
+            aligned_a, aligned_b, score = ipf.read().split('\n')[:3]
+        # mark the entry as recently used
+        os.utime(entry)
+        return aligned_a, aligned_b, float(score)
+    except (OSError, ValueError):
+        pass
+
+    alignment = sequence_aligner.global_align(seq_a, seq_b, backend)
+    # an unusable cache directory leaves the result uncached
+    size = store(alignment, entry)
+    if size:
+        added(cache_dir, get_max_bytes() if max_bytes is None else max_bytes,
+              '.aln', size)
+    return alignment
+
+
+def store(alignment, entry):
+    """
+    Writes an alignment to a cache entry. It is written to a temporary file
+    first and renamed, so concurrent readers never see a partial entry.
+    Returns the size of the entry, 0 if it was not written.
+    """
+    cache_dir = os.path.dirname(entry)
+    tmp_file = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(suffix='.aln.tmp', dir=cache_dir)
+        with os.fdopen(fd, 'wt') as opf:
+            opf.write('%s\n%s\n%r\n' % alignment)
+        os.replace(tmp_file, entry)
+        return os.path.getsize(entry)
+    except OSError:
+        return 0
+    finally:
+        if tmp_file is not None and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def main():
+    parser = ArgumentParser(description='Clear the cache of pairwise '
+                            'alignments.')
+    parser.add_argument('--clear', dest='clear', action='store_true',
+                        help='remove every entry from the cache')
+    args = parser.parse_args()
+
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        raise SystemExit('Caching is turned off, ALIGNMENT_CACHE_DIR is empty.')
+    if args.clear and os.path.isdir(cache_dir):
+        evict(cache_dir, 0, '.aln')
+    num_entries = len([n for n in os.listdir(cache_dir) if n.endswith('.aln')]
+                      ) if os.path.isdir(cache_dir) else 0
+    print(num_entries, 'alignments in', cache_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+This script compares the time it takes to globally align long, nearly
+identical sequences, as a PDB chain and its UniProt sequence are, with each
+backend in sequence_aligner.py, and checks that they agree on the score.
+"""
+
+# imports from the standard library
+import random
+import time
+from argparse import ArgumentParser
+# imports from external libraries
+from Bio import SeqIO
+# imports from this repository
+import sequence_aligner
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def mutate(seq, identity, rng):
+    """
+    A copy of seq with about (1 - identity) of its residues substituted,
+    inserted or deleted, and a few residues cut from both termini.
+    """
+    mutated = []
+    for aa in seq:
+        r = rng.random()
+        if r < (1 - identity) * 0.8:
+            mutated.append(rng.choice(AMINO_ACIDS))
+        elif r < (1 - identity) * 0.9:
+            mutated.append(aa + rng.choice(AMINO_ACIDS))
+        elif r >= (1 - identity):
+            mutated.append(aa)
+    cut = len(seq) // 50
+    return ''.join(mutated)[cut:len(mutated) - cut]
+
+
+def best_time(func, repeats):
+    """
+    The shortest of several wall-clock timings of func, in seconds, and the
+    value func returned.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-f', '--fasta', dest='fasta',
+                        help='a fasta file of sequences to align against '
+                        'mutated copies of themselves, instead of random '
+                        'sequences')
+    parser.add_argument('-l', '--lengths', dest='lengths', type=int,
+                        nargs='+', default=[500, 1000, 2000, 4000],
+                        help='lengths of random sequences to align')
+    parser.add_argument('-b', '--backends', dest='backends', nargs='+',
+                        default=list(sequence_aligner.BACKENDS),
+                        choices=list(sequence_aligner.BACKENDS),
+                        help='backends to time')
+    parser.add_argument('--max-old-length', dest='max_old_length', type=int,
+                        default=4000, help='skip pairwise2 for longer '
+                        'sequences, it needs time and memory quadratic in '
+                        'the length')
+    parser.add_argument('-i', '--identity', dest='identity', type=float,
+                        default=0.95, help='identity of the mutated copies')
+    parser.add_argument('-n', '--repeats', dest='repeats', type=int,
+                        default=1, help='number of timings per pair')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    if args.fasta is not None:
+        seqs = [(r.id, str(r.seq)) for r in SeqIO.parse(args.fasta, 'fasta')]
+    else:
+        seqs = [('random%d' % n, ''.join(rng.choice(AMINO_ACIDS)
+                                         for _ in range(n)))
+                for n in args.lengths]
+
+    print('%-20s %8s' % ('sequence', 'length') +
+          ''.join(' %16s' % b for b in args.backends) + '  scores agree')
+    for name, seq in seqs:
+        other = mutate(seq, args.identity, rng)
+        timings, scores = [], []
+        for backend in args.backends:
+            if backend == 'pairwise2' and len(seq) > args.max_old_length:
+                timings.append(' %16s' % 'skipped')
+                continue
+            aligner = sequence_aligner.get_aligner(backend)
+            elapsed, alignment = best_time(lambda: aligner.align(seq, other),
+                                           args.repeats)
+            timings.append(' %14.1fms' % (elapsed * 1000))
+            scores.append(alignment[2])
+        print('%-20s %8d' % (name[:20], len(seq)) + ''.join(timings) +
+              '  %s' % (max(scores) - min(scores) < 1e-6))
+
+
+if __name__ == '__main__':
+    main()
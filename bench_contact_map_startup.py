@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+This script measures the import time of contact_map.py with python -X importtime
+and fails if the compute path pulls in plotting or unused modules again.
+"""
+
+# imports from the standard library
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+# modules that must not be imported unless a contact map is drawn
+FORBIDDEN = ('matplotlib', 'pylab', 'pandas')
+
+
+def measure_import(module, repeats=5):
+    """
+    Imports the given module in fresh interpreters under -X importtime.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module to import.
+    repeats : int
+        Number of fresh interpreters to time.
+
+    Returns
+    -------
+    tuple
+        The smallest total import time in microseconds and the names of all
+        the modules imported on the way.
+    """
+    best = None
+    imported = set()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(repeats):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+            cwd=here, stderr=subprocess.PIPE, universal_newlines=True,
+            check=True
+        )
+        # lines look like: import time:  self [us] | cumulative | package
+        total = 0
+        for l in proc.stderr.splitlines():
+            if not l.startswith('import time:') or 'cumulative' in l:
+                continue
+            _, cumulative, name = l[len('import time:'):].split('|')
+            if not name.startswith(' ' * 2):
+                total += int(cumulative)
+            imported.add(name.strip().split('.')[0])
+        best = total if best is None else min(best, total)
+    return best, imported
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-m', '--module', dest='module', default='contact_map',
+                        help='module whose import time to measure')
+    parser.add_argument('-n', '--repeats', dest='repeats', type=int, default=5,
+                        help='number of fresh interpreters to time')
+    parser.add_argument('--max-ms', dest='max_ms', type=float,
+                        help='fail if importing takes longer than this')
+    args = parser.parse_args()
+
+    total, imported = measure_import(args.module, args.repeats)
+    print('import %s: %.1f ms (best of %d)' % (args.module, total / 1000,
+                                               args.repeats))
+
+    status = 0
+    for name in FORBIDDEN:
+        if name in imported:
+            print('Regression:', name, 'is imported at startup')
+            status = 1
+    if args.max_ms is not None and total / 1000 > args.max_ms:
+        print('Regression: import took longer than %.1f ms' % args.max_ms)
+        status = 1
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
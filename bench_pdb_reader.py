@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+This script compares the time it takes to read PDB files with Bio.PDB's
+PDBParser and with the fixed-column reader in pdb_reader.py.
+"""
+
+# imports from the standard library
+import time
+import warnings
+from argparse import ArgumentParser
+# imports from external libraries
+from Bio.PDB import PDBParser
+# imports from this repository
+import pdb_reader
+
+
+def best_time(func, repeats):
+    """
+    The shortest of several wall-clock timings of func, in seconds.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--pdb', dest='pdbs', nargs='+', required=True,
+                        help='PDB files to read, preferably large ones')
+    parser.add_argument('-n', '--repeats', dest='repeats', type=int,
+                        default=3, help='number of timings per file')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    pdb_parser = PDBParser(PERMISSIVE=1, QUIET=True)
+    print('%-30s %8s %12s %12s %8s' % ('file', 'atoms', 'PDBParser',
+                                       'pdb_reader', 'speedup'))
+    for pdb_file in args.pdbs:
+        n_atoms = len(pdb_reader.read_atoms(pdb_file))
+        slow = best_time(lambda: pdb_parser.get_structure('bench', pdb_file),
+                         args.repeats)
+        fast = best_time(lambda: pdb_reader.read_atoms(pdb_file), args.repeats)
+        print('%-30s %8d %10.1fms %10.1fms %7.1fx' % (
+            pdb_file, n_atoms, slow * 1000, fast * 1000, slow / fast))
+
+
+if __name__ == '__main__':
+    main()
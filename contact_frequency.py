@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+"""
+This script counts how often each pair of residues is in contact across an
+ensemble of structures, e.g. docking decoys or the models of an NMR entry.
+Structures are streamed one model at a time and only a running count matrix
+is kept in memory, so ensembles of any size can be summarized. Shards of an
+ensemble can be counted separately and merged at the end.
+"""
+
+# imports from the standard library
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+# imports from external libraries
+import numpy as np
+from Bio.PDB import is_aa
+# imports from this repository
+from contact_map import compute_contacts
+import pdb_reader
+
+
+def iter_models(pdb_file):
+    """
+    Streams the models in a PDB file one at a time.
+
+    Only amino acid residues are kept and, for atoms with alternate
+    locations, only the first location seen. PDB files, plain or
+    gzip-compressed, are read line by line; mmCIF files are read whole with
+    pdb_reader and then handed out one model at a time.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to a PDB or mmCIF file with one or more models.
+
+    Yields
+    ------
+    tuple
+        The (n_atoms, 3) coordinates of the model, the index of the first
+        atom of each residue and a residue label (chain ID, residue sequence
+        number and insertion code) for each residue.
+    """
+    if pdb_reader.is_mmcif(pdb_file):
+        atoms = pdb_reader.read_atoms(pdb_file)
+        atoms = atoms.select(pdb_reader.amino_acids(atoms) &
+                             pdb_reader.first_altloc(atoms))
+        for model in np.unique(atoms.model):
+            model_atoms = atoms.select(atoms.model == model)
+            offsets = model_atoms.residue_starts()
+            yield (model_atoms.coords.astype('float64'), offsets,
+                   model_atoms.residue_labels(offsets))
+        return
+
+    coords, offsets, labels = [], [], []
+    altlocs = {}
+    with pdb_reader.open_text(pdb_file) as ipf:
+        for l in ipf:
+            if l.startswith(('ATOM', 'HETATM')):
+                if not is_aa(l[17:20]):
+                    continue
+                # skip alternate locations other than the first one
+                altloc = l[16]
+                if altloc != ' ':
+                    atom_key = l[12:16] + l[21:27]
+                    if altlocs.setdefault(atom_key, altloc) != altloc:
+                        continue
+                label = l[21] + l[22:27].strip()
+                if not labels or labels[-1] != label:
+                    labels.append(label)
+                    offsets.append(len(coords))
+                coords.append((float(l[30:38]), float(l[38:46]), float(l[46:54])))
+            elif l.startswith('ENDMDL') and coords:
+                yield np.array(coords), np.array(offsets), labels
+                coords, offsets, labels = [], [], []
+                altlocs = {}
+    # files without MODEL/ENDMDL records hold a single model
+    if coords:
+        yield np.array(coords), np.array(offsets), labels
+
+
+class ContactFrequency:
+    """
+    A running count of how many models each residue pair is in contact in.
+    """
+    def __init__(self, cutoff=4.5):
+        """
+
+        Parameters
+        ----------
+        cutoff : float
+            Two residues are in contact if their shortest heavy atom distance
+            is at most cutoff.
+        """
+        self.cutoff = cutoff
+        self.labels = None
+        self.counts = None
+        self.num_models = 0
+
+    def update(self, coords, offsets, labels):
+        """
+        Adds the contacts of one model to the running counts.
+
+        Parameters
+        ----------
+        coords : numpy.ndarray
+            Atom coordinates of the model.
+        offsets : numpy.ndarray
+            Index of the first atom of each residue.
+        labels : list
+            Residue labels, must be the same for every model.
+        """
+        if self.counts is None:
+            self.labels = list(labels)
+            self.counts = np.zeros((len(labels), len(labels)), dtype='uint32')
+        elif list(labels) != self.labels:
+            raise ValueError('The residues of the given model differ from '
+                             'those of the models counted so far.')
+        rows, cols, _ = compute_contacts(coords, offsets, self.cutoff)
+        self.counts[rows, cols] += 1
+        self.num_models += 1
+
+    def add_file(self, pdb_file):
+        """
+        Adds the contacts of every model in the given PDB file.
+        """
+        for coords, offsets, labels in iter_models(pdb_file):
+            self.update(coords, offsets, labels)
+
+    def merge(self, other):
+        """
+        Adds the counts of another accumulator, e.g. one from another shard
+        of the same ensemble, to this one in place.
+        """
+        if other.counts is None:
+            return
+        if other.cutoff != self.cutoff:
+            raise ValueError('Cannot merge counts made with different '
+                             'cutoffs: %s vs %s' % (self.cutoff, other.cutoff))
+        if self.counts is None:
+            self.labels = list(other.labels)
+            self.counts = other.counts.copy()
+        elif other.labels != self.labels:
+            raise ValueError('Cannot merge counts over different residues.')
+        else:
+            self.counts += other.counts
+        self.num_models += other.num_models
+
+    def frequencies(self):
+        """
+        Symmetric matrix of the fraction of models in which each residue pair
+        is in contact.
+        """
+        counts = self.counts + np.triu(self.counts, 1).T
+        return counts / max(self.num_models, 1)
+
+    def save(self, output):
+        """
+        Writes the counts to a compressed NumPy .npz file.
+        """
+        np.savez_compressed(output, counts=self.counts,
+                            num_models=self.num_models, cutoff=self.cutoff,
+                            labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, npz_file):
+        """
+        Reads counts written by save.
+        """
+        with np.load(npz_file) as data:
+            accumulator = cls(float(data['cutoff']))
+            accumulator.counts = data['counts']
+            accumulator.num_models = int(data['num_models'])
+            accumulator.labels = data['labels'].tolist()
+        return accumulator
+
+
+def count_shard(pdb_files, cutoff):
+    """
+    Counts the contacts over the given PDB files in a worker process.
+    """
+    accumulator = ContactFrequency(cutoff)
+    for pdb_file in pdb_files:
+        accumulator.add_file(pdb_file)
+    return accumulator
+
+
+def parse_cmd_arguments():
+    # setting up
+    parser = ArgumentParser(description='Count residue contacts across an '
+                            'ensemble of structures.')
+    parser.add_argument('-p', '--pdb', dest='pdbs', nargs='+', default=[],
+                        help='PDB files, each with one or more models')
+    parser.add_argument('-l', '--list', dest='list',
+                        help='a file containing a list of PDB files one per '
+                        'line')
+    parser.add_argument('-m', '--merge', dest='merge', nargs='+', default=[],
+                        help='counts previously written by this script, '
+                        'e.g. for other shards of the ensemble, to add')
+    parser.add_argument('-c', '--cutoff', dest='cutoff', type=float,
+                        default=4.5, help='contact distance cutoff between '
+                        'heavy atoms, default 4.5')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('-o', '--output', dest='output', required=True,
+                        help='a .npz file in which to write the counts')
+    # do any checking on command-line arguments here, if necessary
+    return parser.parse_args()
+
+
+def main():
+    # parse command-line arguments
+    args = parse_cmd_arguments()
+
+    # collect the structures of the ensemble
+    pdb_files = list(args.pdbs)
+    if args.list is not None:
+        with open(args.list, 'rt') as ipf:
+            pdb_files += [l.strip() for l in ipf if l.strip()]
+
+    # count contacts, split into one shard per worker
+    accumulator = ContactFrequency(args.cutoff)
+    if args.jobs > 1 and len(pdb_files) > 1:
+        shards = [pdb_files[i::args.jobs] for i in range(args.jobs)]
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            for shard in executor.map(count_shard, shards,
+                                      [args.cutoff] * len(shards)):
+                accumulator.merge(shard)
+    else:
+        for pdb_file in pdb_files:
+            accumulator.add_file(pdb_file)
+
+    # add counts from other shards
+    for npz_file in args.merge:
+        accumulator.merge(ContactFrequency.load(npz_file))
+
+    if accumulator.counts is None:
+        sys.exit('No model was found in the given structures.')
+    accumulator.save(args.output)
+    print('Contacts counted over', accumulator.num_models, 'models written '
+          'to', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 from argparse import ArgumentParser
-from Bio.PDB import PDBParser, is_aa
+from Bio.PDB import is_aa
 import numpy as np
-import pandas as pd
-import matplotlib as plt
-import pylab
 from itertools import combinations_with_replacement
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pdb_reader
+import structure_cache
+
+# matplotlib and pylab are only imported by load_plotting, the first time a map is drawn
+plt = None
+pylab = None
 
 
 def compute_sc_centroid(residue):
@@ -28,6 +33,67 @@ def compute_sc_centroid(residue):
     return centroid / number_sidechain_atoms
 
 
+def compute_sc_centroids(residues):
+    '''
+    Side chain centroids of all the given residues as an (N, 3) array, computed once per structure
+    with the same rules as compute_sc_centroid: CA coordinates for glycines and NaN for other
+    residues without side chain atoms.
+    '''
+    coords, offsets = pack_atom_coords(residues)
+    atom_names = np.array([a.get_name() for r in residues for a in r.get_list()])
+    centroids = compute_packed_sc_centroids(coords, offsets, atom_names, np.zeros(len(residues), dtype='bool'))
+
+    # return CA coordinates if residue is GLY
+    for i, residue in enumerate(residues):
+        if residue.get_resname() == "GLY":
+            centroids[i] = residue['CA'].get_coord()
+    return centroids
+
+
+def compute_packed_sc_centroids(coords, offsets, atom_names, is_glycine):
+    '''
+    Side chain centroids from packed atom coordinates, the name of each atom and a glycine mask over
+    the residues. Glycines are represented by their CA, or NaN if they have none.
+    '''
+    backbone_atoms = ['N', 'CA', 'C', 'O']
+    is_sidechain = ~np.isin(atom_names, backbone_atoms)
+    sums = np.add.reduceat(coords * is_sidechain[:, np.newaxis], offsets, axis=0)
+    counts = np.add.reduceat(is_sidechain.astype('int64'), offsets)
+
+    # CA coordinates for glycines, summed the same way
+    is_ca = atom_names == 'CA'
+    ca_sums = np.add.reduceat(coords * is_ca[:, np.newaxis], offsets, axis=0)
+    ca_counts = np.add.reduceat(is_ca.astype('int64'), offsets)
+    sums[is_glycine] = ca_sums[is_glycine]
+    counts[is_glycine] = ca_counts[is_glycine]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts[:, np.newaxis]
+
+
+def compute_centroid_dist_matrix(centroids, block_size=2**20):
+    '''
+    The Euclidean distances between all pairs of the given side chain centroids, computed a block of
+    rows at a time.
+    '''
+    num_residues = len(centroids)
+    dist_mat = np.empty((num_residues, num_residues), dtype='float64')
+    rows = max(block_size // max(num_residues, 1), 1)
+    for start in range(0, num_residues, rows):
+        diff = centroids[start:start + rows, np.newaxis, :] - centroids[np.newaxis, :, :]
+        dist_mat[start:start + rows] = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+    return dist_mat
+
+
+def compute_centroid_contacts(centroids, cutoff=12.0):
+    '''
+    Sparse residue pairs whose side chain centroids are at most cutoff apart, in the same COO form
+    as compute_contacts. Residues without a centroid are left out.
+    '''
+    has_centroid = np.flatnonzero(~np.isnan(centroids).any(axis=1))
+    rows, cols, dists = compute_contacts(centroids[has_centroid], np.arange(len(has_centroid)), cutoff)
+    return has_centroid[rows], has_centroid[cols], dists
+
+
 def compute_distance(res_a, res_b):
     '''
     The Euclidean distance between the centroid of residue A and the centroid of residue B.
@@ -44,6 +110,168 @@ def compute_shortest_distance(res_a, res_b):
     distances = [np.linalg.norm(atom_a - atom_b) for atom_a in res_a.get_list() for atom_b in res_b.get_list()]
     return min(distances)
 
+def pack_atom_coords(residues):
+    '''
+    Packs the coordinates of all the atoms of the given residues into one contiguous (n_atoms, 3)
+    array. Also returns the index of the first atom of each residue in that array.
+    '''
+    atoms_per_residue = [len(r.get_list()) for r in residues]
+    offsets = np.zeros(len(residues), dtype='int64')
+    np.cumsum(atoms_per_residue[:-1], out=offsets[1:])
+    coords = np.array([a.get_coord() for r in residues for a in r.get_list()], dtype='float64')
+    return coords.reshape(-1, 3), offsets
+
+
+def compute_min_dist_matrix(coords, offsets, symmetric=True, block_size=2**20):
+    '''
+    Residue-residue shortest heavy atom distances from packed atom coordinates.
+
+    Atoms of a block of residues are broadcast against the atoms of all the residues that follow,
+    and the per-atom distances are reduced to per-residue minima with minimum.reduceat. Only the
+    upper triangle is computed. block_size bounds the number of atom pairs held in memory at once.
+    '''
+    num_residues = len(offsets)
+    num_atoms = len(coords)
+    ends = np.append(offsets[1:], num_atoms)
+    dist_mat = np.full((num_residues, num_residues), np.nan, dtype='float64')
+
+    start = 0
+    while start < num_residues:
+        # grow the block of residues until it holds block_size atom pairs
+        max_atoms = max(block_size // max(num_atoms - offsets[start], 1), 1)
+        stop = int(np.searchsorted(ends, offsets[start] + max_atoms, side='right'))
+        stop = max(stop, start + 1)
+
+        # squared distances between the atoms in the block and the atoms of residues start onward
+        block = coords[offsets[start]:ends[stop - 1]]
+        others = coords[offsets[start]:]
+        diff = block[:, np.newaxis, :] - others[np.newaxis, :, :]
+        sq_dists = np.einsum('ijk,ijk->ij', diff, diff)
+
+        # reduce over the atoms of the other residues, then over the atoms in the block
+        sq_dists = np.minimum.reduceat(sq_dists, offsets[start:] - offsets[start], axis=1)
+        sq_dists = np.minimum.reduceat(sq_dists, offsets[start:stop] - offsets[start], axis=0)
+        dist_mat[start:stop, start:] = np.sqrt(sq_dists)
+        start = stop
+
+    # residue pairs below the diagonal of a block were computed as well
+    lower = np.tril_indices(num_residues, -1)
+    if symmetric:
+        dist_mat[lower] = dist_mat.T[lower]
+    else:
+        dist_mat[lower] = np.nan
+    return dist_mat
+
+
+def compute_dist_matrix_fast(residues, symmetric=True):
+    '''
+    Same matrix as compute_dist_matrix, computed with batched NumPy operations over packed
+    atom coordinates instead of a Python loop over residue pairs.
+    '''
+    coords, offsets = pack_atom_coords(residues)
+    return compute_min_dist_matrix(coords, offsets, symmetric)
+
+
+def compute_contacts(coords, offsets, cutoff=12.0, chunk_size=2**22):
+    '''
+    Sparse residue contacts whose shortest heavy atom distance is at most cutoff.
+
+    Atoms are binned into a cell list with cells of edge length cutoff, so only atoms in the
+    same or adjacent cells are ever compared. Each pair of adjacent cells is visited once through
+    the 13 forward neighbor offsets. chunk_size bounds the number of candidate atom pairs held in
+    memory at once.
+
+    Returns the contacts in COO form as three arrays, row and column residue indices (row <= col,
+    sorted by row then column) and the shortest distances, the diagonal included.
+    '''
+    num_residues = len(offsets)
+    num_atoms = len(coords)
+    if num_atoms == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'), np.zeros(0, dtype='float64')
+    residue_of_atom = np.repeat(np.arange(num_residues), np.diff(np.append(offsets, num_atoms)))
+
+    # bin atoms into cells and sort them by cell
+    cells = np.floor((coords - coords.min(axis=0)) / cutoff).astype('int64')
+    dims = cells.max(axis=0) + 1
+    cell_ids = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(cell_ids, kind='stable')
+    coords = coords[order]
+    residue_of_atom = residue_of_atom[order]
+    cells = cells[order]
+    cell_ids = cell_ids[order]
+    occupied, cell_starts, cell_counts = np.unique(cell_ids, return_index=True, return_counts=True)
+    cell_of_atom = np.searchsorted(occupied, cell_ids)
+
+    # the cell itself plus the 13 neighbor offsets that come after it
+    shifts = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+              if (dx, dy, dz) >= (0, 0, 0)]
+
+    keys, sq_dists = [], []
+    for shift in shifts:
+        if shift == (0, 0, 0):
+            # pair each atom with itself and the atoms that follow it in the same cell
+            partner_starts = np.arange(num_atoms)
+            partner_counts = cell_starts[cell_of_atom] + cell_counts[cell_of_atom] - partner_starts
+        else:
+            neighbors = cells + shift
+            in_grid = np.all((neighbors >= 0) & (neighbors < dims), axis=1)
+            neighbor_ids = (neighbors[:, 0] * dims[1] + neighbors[:, 1]) * dims[2] + neighbors[:, 2]
+            slots = np.minimum(np.searchsorted(occupied, neighbor_ids), len(occupied) - 1)
+            found = in_grid & (occupied[slots] == neighbor_ids)
+            partner_starts = np.where(found, cell_starts[slots], 0)
+            partner_counts = np.where(found, cell_counts[slots], 0)
+
+        # expand the partner ranges into atom pairs, a bounded number of pairs at a time
+        pair_ends = np.cumsum(partner_counts)
+        atom = 0
+        while atom < num_atoms:
+            done = pair_ends[atom - 1] if atom > 0 else 0
+            stop = int(np.searchsorted(pair_ends, done + chunk_size, side='right'))
+            stop = max(stop, atom + 1)
+            counts = partner_counts[atom:stop]
+            i = np.repeat(np.arange(atom, stop), counts)
+            first = np.cumsum(counts) - counts
+            j = np.arange(len(i)) - np.repeat(first - partner_starts[atom:stop], counts)
+            atom = stop
+
+            diff = coords[i] - coords[j]
+            d2 = np.einsum('ij,ij->i', diff, diff)
+            close = d2 <= cutoff * cutoff
+            res_i = residue_of_atom[i[close]]
+            res_j = residue_of_atom[j[close]]
+            chunk_keys = np.minimum(res_i, res_j) * num_residues + np.maximum(res_i, res_j)
+            chunk_keys, chunk_d2 = _min_by_key(chunk_keys, d2[close])
+            keys.append(chunk_keys)
+            sq_dists.append(chunk_d2)
+
+    keys, d2 = _min_by_key(np.concatenate(keys), np.concatenate(sq_dists))
+    return keys // num_residues, keys % num_residues, np.sqrt(d2)
+
+
+def _min_by_key(keys, values):
+    '''
+    Unique keys in ascending order and the smallest of the values given for each of them.
+    '''
+    order = np.lexsort((values, keys))
+    keys = keys[order]
+    first = np.ones(len(keys), dtype='bool')
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], values[order][first]
+
+
+def load_plotting():
+    '''
+    Imports matplotlib, with the non-interactive Agg backend, and pylab on first use.
+    '''
+    global plt, pylab
+    if pylab is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot
+        import pylab as _pylab
+        plt, pylab = matplotlib, _pylab
+
+
 def px2pt(p):
     '''
     '''
@@ -51,6 +279,7 @@ def px2pt(p):
 
 
 def init_spines(hidden=[]):
+    load_plotting()
     ax = pylab.gca()
 
     all_spines = ['bottom', 'left', 'top', 'right', 'polar']
@@ -67,6 +296,7 @@ def init_spines(hidden=[]):
 
 
 def init_pylab(font_kwargs={}):
+    load_plotting()
     plt.rc('lines', linewidth=px2pt(2))
     plt.rc('xtick', **{'direction': 'out'})
     plt.rc('ytick', **{'direction': 'out'})
@@ -101,33 +331,114 @@ def compute_dist_matrix(residues, symmetric=True):
     return dist_mat
 
 
-def main():
-    # command line argument parser
-    parser = ArgumentParser(description='Compute a distance matrix given two list of residues.')
-    parser.add_argument('-p', '--pdb', dest='pdb', help='input file in PDB format')
-    parser.add_argument('-o', '--output', dest='output', help='name to the file to which to write the distance matrix')
+def get_residues(pdb_file):
+    '''
+    Amino acid residues of the first model in the given PDB or mmCIF file, plain or gzip-compressed.
+    '''
+    structure = pdb_reader.parse_structure(pdb_file)
+    model = structure[0]
+    return [r for r in model.get_residues() if is_aa(r)]
 
-    # parse command line arguments
-    args = parser.parse_args()
 
-    # parse the given PDB file
-    pdb_parser = PDBParser(PERMISSIVE=1)
-    structure = pdb_parser.get_structure(id='pdb', file=args.pdb)
-    model = structure[0]
+def read_packed_residues(pdb_file):
+    '''
+    Reads the residues get_residues would return with the fast fixed-column reader, through the
+    parsed structure cache, instead of PDBParser. Only the first of several alternate locations of
+    an atom is kept (PDBParser keeps the one with the highest occupancy).
 
-    # get all the residues
-    residues = [r for r in model.get_residues() if is_aa(r)]
+    Returns the packed atom coordinates, the residue offsets, the atom names, a glycine mask over
+    the residues and the residue labels.
+    '''
+    atoms = structure_cache.load_atoms(pdb_file)
+    atoms = atoms.select((atoms.model == 0) & pdb_reader.amino_acids(atoms) & pdb_reader.first_altloc(atoms))
+    offsets = atoms.residue_starts()
+    return (atoms.coords.astype('float64'), offsets, atoms.name.astype('U4'), atoms.resname[offsets] == b'GLY',
+            atoms.residue_labels(offsets))
 
-    # compute pair distances between residues in the first chain and residues in the second chain
-    dist_mat = compute_dist_matrix(residues)
 
-    # make a contact map
+def load_structure(pdb_file, centroid=False, fast=False):
+    '''
+    Packed atom coordinates, residue offsets, side chain centroids (None unless centroid is set) and
+    residue labels of a PDB file, read with PDBParser or with the fast fixed-column reader.
+    '''
+    if fast:
+        coords, offsets, atom_names, is_glycine, labels = read_packed_residues(pdb_file)
+        centroids = compute_packed_sc_centroids(coords, offsets, atom_names, is_glycine) if centroid else None
+        return coords, offsets, centroids, labels
+    residues = get_residues(pdb_file)
+    coords, offsets = pack_atom_coords(residues)
+    centroids = compute_sc_centroids(residues) if centroid else None
+    return coords, offsets, centroids, get_residue_labels(residues)
+
+
+def get_residue_labels(residues):
+    '''
+    Chain ID, residue sequence number and insertion code of each residue, e.g. A42 or B100A.
+    '''
+    return [r.get_parent().get_id() + str(r.get_id()[1]) + r.get_id()[2].strip() for r in residues]
+
+
+def save_dist_matrix(output, dist_mat, fmt='npy', labels=None):
+    '''
+    Writes a distance matrix to disk in one of the following formats:
+
+        npy     a NumPy .npy file with the float64 matrix
+        memmap  a NumPy .npy file with the matrix as float32, to be memory-mapped when loaded
+        npz     a compressed NumPy .npz file with the matrix under 'dist' and the residue
+                labels under 'labels'
+
+    The extension of the format, .npy or .npz, is appended to the file name unless it already ends
+    with it. Returns the name of the file written.
+    '''
+    if fmt not in ('npy', 'memmap', 'npz'):
+        raise ValueError('Unknown distance matrix format: ' + fmt)
+    extension = '.npz' if fmt == 'npz' else '.npy'
+    if not output.endswith(extension):
+        output += extension
+    if fmt == 'npy':
+        np.save(output, dist_mat)
+    elif fmt == 'memmap':
+        mapped = np.lib.format.open_memmap(output, mode='w+', dtype='float32', shape=dist_mat.shape)
+        mapped[:] = dist_mat
+        mapped.flush()
+        del mapped
+    else:
+        if labels is None:
+            labels = []
+        np.savez_compressed(output, dist=dist_mat, labels=np.array(labels))
+    return output
+
+
+def load_dist_matrix(matrix_file):
+    '''
+    Reads a distance matrix written by save_dist_matrix. .npy files are memory-mapped.
+    '''
+    if matrix_file.endswith('.npz'):
+        with np.load(matrix_file) as data:
+            return data['dist']
+    return np.load(matrix_file, mmap_mode='r')
+
+
+def write_contacts(output, rows, cols, dists):
+    '''
+    Writes a sparse contact list as a whitespace separated text file.
+    '''
+    np.savetxt(output, np.column_stack((rows, cols, dists)), fmt=['%d', '%d', '%.3f'],
+               header='residue_i residue_j distance')
+
+
+def plot_contact_map(dist_mat, output):
+    '''
+    Draws the given distance matrix as a contact map and saves it to output.
+    '''
+    load_plotting()
+    num_residues = len(dist_mat)
     init_pylab({'family': 'sans-serif', 'size': 24})
     init_spines(hidden=['bottom', 'left', 'top', 'right'])
     pylab.gcf().set_figwidth(10)
     pylab.gcf().set_figheight(10)
-    pylab.xlim(1, len(residues) + 1)
-    pylab.ylim(1, len(residues) + 1)
+    pylab.xlim(1, num_residues + 1)
+    pylab.ylim(1, num_residues + 1)
     pylab.xlabel('Residue index')
     pylab.ylabel('Residue index')
     ax, fig = pylab.gca(), pylab.gcf()
@@ -145,10 +456,187 @@ def main():
     # ax.set_title(args.pdb.split('.')[0] + 'contact map', fontweight='bold')
 
     # save the map
-    pylab.savefig(args.output, bbox_inches='tight', dpi=300)
+    pylab.savefig(output, bbox_inches='tight', dpi=300)
+
+
+def residue_dist_matrix(coords, offsets, centroids=None):
+    '''
+    Dense matrix of shortest heavy atom distances, or of side chain centroid distances if centroids
+    are given.
+    '''
+    if centroids is not None:
+        return compute_centroid_dist_matrix(centroids)
+    return compute_min_dist_matrix(coords, offsets)
+
+
+def residue_contacts(coords, offsets, cutoff, centroids=None):
+    '''
+    Sparse contact list by shortest heavy atom distance, or by side chain centroid distance if
+    centroids are given.
+    '''
+    if centroids is not None:
+        return compute_centroid_contacts(centroids, cutoff)
+    return compute_contacts(coords, offsets, cutoff)
+
 
+def output_names(pdb_files):
+    '''
+    Name of the output file of each PDB file in batch mode: the file name without its extension, or,
+    where other PDB files share it, e.g. models named alike in different directories or 1abc.pdb
+    and 1abc.cif, the path relative to the directory they have in common, with / replaced by _.
+
+    Raises ValueError if a PDB file is listed twice.
+    '''
+    def stem(pdb_file):
+        name = os.path.basename(pdb_file)
+        if name.endswith('.gz'):
+            name = name[:-3]
+        return os.path.splitext(name)[0]
+
+    paths = [os.path.abspath(f) for f in pdb_files]
+    if len(set(paths)) < len(paths):
+        raise ValueError('PDB files are listed more than once.')
+    stems = [stem(f) for f in paths]
+    shared = {}
+    for path, name in zip(paths, stems):
+        shared.setdefault(name, []).append(path)
+    names = []
+    for path, name in zip(paths, stems):
+        if len(shared[name]) > 1:
+            common = os.path.commonpath(shared[name])
+            name = os.path.relpath(path, common).replace(os.sep, '_')
+        names.append(name)
+    if len(set(names)) < len(names):
+        raise ValueError('PDB files would be written to the same output files.')
+    return names
+
+
+def process_structure(pdb_file, output_dir, cutoff=None, fmt='npy', centroid=False, fast=False,
+                      name=None):
+    '''
+    Batch mode worker. Parses one PDB file and writes its distance matrix in the given format (or
+    its contact list if a cutoff is given) into output_dir, named after the PDB file or the given
+    name.
+
+    Returns the path to the file written.
+    '''
+    if name is None:
+        name = output_names([pdb_file])[0]
+    coords, offsets, centroids, labels = load_structure(pdb_file, centroid, fast)
+    if cutoff is not None:
+        output = os.path.join(output_dir, name + '.contacts.txt')
+        write_contacts(output, *residue_contacts(coords, offsets, cutoff, centroids))
+    else:
+        output = os.path.join(output_dir, name + ('.npz' if fmt == 'npz' else '.npy'))
+        save_dist_matrix(output, residue_dist_matrix(coords, offsets, centroids), fmt, labels)
+    return output
+
+
+def run_batch(pdb_files, output_dir, cutoff=None, jobs=None, fmt='npy', centroid=False, fast=False):
+    '''
+    Spreads the given PDB files over a pool of worker processes, one matrix file per structure,
+    named by output_names.
+
+    Returns the number of structures that failed.
+    '''
+    names = output_names(pdb_files)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    num_failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(process_structure, f, output_dir, cutoff, fmt, centroid, fast, n): f
+                   for f, n in zip(pdb_files, names)}
+        for future in as_completed(futures):
+            try:
+                print('Written', future.result())
+            except Exception as e:
+                print('Failed to process', futures[future] + ':', e, file=sys.stderr)
+                num_failed += 1
+    return num_failed
+
+
+def main():
+    # command line argument parser
+    parser = ArgumentParser(description='Compute a distance matrix given two list of residues.')
+    parser.add_argument('-p', '--pdb', dest='pdb', help='input file in PDB format')
+    parser.add_argument('-l', '--list', dest='list',
+                        help='a file containing a list of PDB files one per line, or a directory of PDB files')
+    parser.add_argument('-o', '--output', dest='output',
+                        help='name to the file to which to write the contact map (or the contact list with '
+                             '--cutoff), or the directory into which to write one matrix per structure '
+                             'with --list')
+    parser.add_argument('-m', '--matrix', dest='matrix',
+                        help='name to the file to which to write the raw distance matrix, .npy or .npz '
+                             'is appended unless it is given')
+    parser.add_argument('-f', '--format', dest='format', choices=['npy', 'memmap', 'npz'], default='npy',
+                        help='format of the distance matrix files: npy, float32 memmap-able npy or '
+                             'compressed npz with residue labels, defaults to npy')
+    parser.add_argument('--no-plot', dest='no_plot', action='store_true',
+                        help='only compute distances, never import matplotlib; -o then names the matrix '
+                             'file if --matrix is not given')
+    parser.add_argument('--plot-from', dest='plot_from',
+                        help='draw the contact map from a previously saved distance matrix instead of a PDB')
+    parser.add_argument('-c', '--cutoff', dest='cutoff', type=float,
+                        help='write a sparse list of residue contacts within this distance instead of a map')
+    parser.add_argument('--centroid', dest='centroid', action='store_true',
+                        help='measure distances between side chain centroids instead of between the closest '
+                             'heavy atoms')
+    parser.add_argument('--fast-reader', dest='fast_reader', action='store_true',
+                        help='read PDB files with the fast fixed-column reader instead of Bio.PDB.PDBParser, '
+                             'through the parsed structure cache (see structure_cache.py)')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='number of worker processes with --list, defaults to the number of CPUs')
+
+    # parse command line arguments
+    args = parser.parse_args()
+
+    # batch mode, every structure is processed by a pool of workers
+    if args.list is not None:
+        if args.output is None:
+            parser.error('--list needs -o, the directory into which to write the matrices')
+        if os.path.isdir(args.list):
+            pdb_files = sorted(os.path.join(args.list, f) for f in os.listdir(args.list)
+                               if f.endswith(('.pdb', '.ent', '.cif', '.pdb.gz', '.ent.gz', '.cif.gz')))
+        else:
+            with open(args.list, 'rt') as f:
+                pdb_files = [l.strip() for l in f if l.strip()]
+        try:
+            num_failed = run_batch(pdb_files, args.output, args.cutoff, args.jobs, args.format,
+                                   args.centroid, args.fast_reader)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        if num_failed:
+            raise SystemExit('%d of %d structures failed.' % (num_failed, len(pdb_files)))
+        return
+
+    # re-render a saved distance matrix, no need to touch the PDB file
+    if args.plot_from is not None:
+        plot_contact_map(load_dist_matrix(args.plot_from), args.output)
+        return
+
+    # get all the residues
+    coords, offsets, centroids, labels = load_structure(args.pdb, args.centroid, args.fast_reader)
+
+    # only residue pairs within the cutoff are wanted, write them as a contact list
+    if args.cutoff is not None:
+        write_contacts(args.output, *residue_contacts(coords, offsets, args.cutoff, centroids))
+        return
+
+    # compute pair distances between residues in the first chain and residues in the second chain
+    dist_mat = residue_dist_matrix(coords, offsets, centroids)
+
+    # store the raw distances for later re-rendering or analysis
+    matrix_file = args.matrix
+    if matrix_file is None and args.no_plot:
+        matrix_file = args.output
+    if matrix_file is not None:
+        matrix_file = save_dist_matrix(matrix_file, dist_mat, args.format, labels)
+        print('Distance matrix written to', matrix_file)
+
+    # make a contact map
+    if args.output is not None and not args.no_plot:
+        plot_contact_map(dist_mat, args.output)
 
 
 if __name__ == '__main__':
     main()
-
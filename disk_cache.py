@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Size bookkeeping shared by the on-disk caches, structure_cache.py and
+alignment_cache.py.
+
+Listing a cache directory of tens of thousands of entries takes longer than
+making most entries, so each process keeps a running estimate of the size of
+a cache: the directory is scanned once, the size of every entry the process
+adds is counted, and entries are only evicted, after another scan, when the
+estimate goes over the bound. Eviction then goes down to EVICT_TO of the
+bound, so that the next few entries do not set off another scan. Entries
+added by other processes are only seen at the next scan, so with concurrent
+writers the cache may briefly grow past its bound.
+"""
+
+# imports from the standard library
+import os
+
+# fraction of the size bound a cache is evicted down to
+EVICT_TO = 0.9
+
+# estimated size of each cache this process added to, keyed by cache
+# directory and entry suffix
+_sizes = {}
+
+
+def evict(cache_dir, max_bytes, suffix):
+    """
+    Removes the least recently used entries, files ending with suffix,
+    until the cache holds at most max_bytes.
+
+    Returns
+    -------
+    int
+        The size of the entries left in the cache.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(suffix):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(e[1] for e in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            pass
+        total -= size
+    _sizes[(cache_dir, suffix)] = total
+    return total
+
+
+def added(cache_dir, max_bytes, suffix, size):
+    """
+    Counts an entry of size bytes added to a cache and evicts the least
+    recently used entries if the cache may have grown past max_bytes.
+    """
+    key = (cache_dir, suffix)
+    if key not in _sizes:
+        total = evict(cache_dir, max_bytes, suffix)
+    else:
+        total = _sizes[key] = _sizes[key] + size
+    if total > max_bytes:
+        evict(cache_dir, int(max_bytes * EVICT_TO), suffix)
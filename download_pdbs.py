@@ -8,8 +8,294 @@
 """
 
 from argparse import ArgumentParser
-import os, sys
-from Bio.PDB import PDBList, PDBParser, PDBIO
+import gzip, hashlib, json, os, tempfile, threading, time
+import http.client
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from Bio.PDB import PDBIO, MMCIFIO
+import pdb_reader
+import structure_cache
+
+# where to download entries from, keyed by database name
+BASE_URLS = { "OPM": "http://opm.phar.umich.edu/pdb/",
+              "RCSB": "https://files.rcsb.org/view/" }
+
+# where to download gzip-compressed entries from; OPM only serves plain files
+GZIP_BASE_URLS = { "RCSB": "https://files.rcsb.org/download/" }
+
+# HTTP status codes that are worth retrying
+RETRY_STATUS = { 429, 500, 502, 503, 504 }
+
+# HTTP status codes of redirects, e.g. from a mirror, followed up to MAX_REDIRECTS times per attempt
+REDIRECT_STATUS = { 301, 302, 303, 307, 308 }
+MAX_REDIRECTS = 5
+
+# one keep-alive connection per host and thread
+_connections = threading.local()
+
+
+def get_connection( scheme, netloc, timeout ):
+    """
+    Returns the calling thread's open connection to the given host, opening one if needed.
+    """
+    pool = _connections.__dict__.setdefault( "pool", {} )
+    key = ( scheme, netloc )
+    if key not in pool:
+        if scheme == "https":
+            pool[key] = http.client.HTTPSConnection( netloc, timeout = timeout )
+        else:
+            pool[key] = http.client.HTTPConnection( netloc, timeout = timeout )
+    return pool[key]
+
+
+def drop_connection( scheme, netloc ):
+    """
+    Closes and forgets the calling thread's connection to the given host.
+    """
+    pool = _connections.__dict__.setdefault( "pool", {} )
+    conn = pool.pop( ( scheme, netloc ), None )
+    if conn is not None:
+        conn.close()
+
+
+def entry_url( db, base_url, four_letter, fmt = "pdb", compressed = False ):
+    """
+    Returns the URL of an entry and whether the body must be gzip-compressed locally, which is
+    the case for compressed downloads from databases that only serve plain files.
+    """
+    name = four_letter + "." + fmt
+    if base_url is not None:
+        # a mirror is expected to serve compressed files next to plain ones
+        return base_url + name + ( ".gz" if compressed else "" ), False
+    if compressed and db in GZIP_BASE_URLS:
+        return GZIP_BASE_URLS[db] + name + ".gz", False
+    return BASE_URLS.get( db, BASE_URLS["RCSB"] ) + name, compressed
+
+
+class Manifest:
+    """
+    An append-only JSON-lines journal of the entries in a download directory. Each line records
+    an entry's status, path, byte size, SHA-256 checksum and time; the last line of an entry wins,
+    so a restarted run knows which entries are complete without looking at the files.
+    """
+    def __init__( self, path ):
+        self.path = path
+        self.entries = {}
+        if os.path.exists( path ):
+            with open( path, "rt" ) as f:
+                for l in f:
+                    try:
+                        record = json.loads( l )
+                    except ValueError:
+                        # a line cut short by an interrupted run
+                        continue
+                    self.entries[record["id"]] = record
+        self.journal = open( path, "at" )
+
+    def get( self, four_letter ):
+        return self.entries.get( four_letter )
+
+    def record( self, four_letter, path, status, size = None, checksum = None, error = None ):
+        record = { "id": four_letter, "path": path, "status": status, "size": size,
+                   "sha256": checksum, "time": time.strftime( "%Y-%m-%dT%H:%M:%S" ) }
+        if error is not None:
+            record["error"] = error
+        self.entries[four_letter] = record
+        self.journal.write( json.dumps( record ) + "\n" )
+        self.journal.flush()
+
+    def close( self ):
+        self.journal.close()
+
+
+def is_complete( data, fmt = "pdb", compressed = False ):
+    """
+    Whether the content of an entry is complete: a gzip stream must decompress up to its end, a
+    PDB file must end with an END record and an mmCIF file with a # line.
+    """
+    if compressed:
+        try:
+            data = gzip.decompress( data )
+        except ( OSError, EOFError ):
+            return False
+    lines = data.rstrip().splitlines()
+    if not lines:
+        return False
+    return lines[-1].startswith( b"END" if fmt == "pdb" else b"#" )
+
+
+def check_file( path, fmt = "pdb", validate = True ):
+    """
+    Returns whether the file at path holds a complete entry, its size and its SHA-256 checksum.
+    """
+    with open( path, "rb" ) as f:
+        data = f.read()
+    complete = not validate or is_complete( data, fmt, path.endswith( ".gz" ) )
+    return complete, len( data ), hashlib.sha256( data ).hexdigest()
+
+
+def fetch( url, path, retries = 3, backoff = 1.0, timeout = 60, compress = False, fmt = "pdb",
+           validate = True ):
+    """
+    Downloads url to path over a reused keep-alive connection, gzip-compressing the body first
+    if compress is set.
+
+    The body is written to a temporary file next to path and renamed once complete, so path
+    never holds a partial download. Redirects are followed, up to MAX_REDIRECTS of them.
+    Connection errors, transient HTTP errors and truncated bodies (see is_complete, unless
+    validate is off) are retried with exponential backoff.
+
+    Returns a tuple of None, the size and the SHA-256 checksum of the stored file on success, or
+    of a message describing the failure, None and None.
+    """
+    compressed = url.endswith( ".gz" )
+    error = None
+    for attempt in range( retries + 1 ):
+        if attempt > 0:
+            time.sleep( backoff * 2 ** ( attempt - 1 ) )
+        location = url
+        try:
+            for _ in range( MAX_REDIRECTS + 1 ):
+                parts = urlsplit( location )
+                target = parts.path + ( "?" + parts.query if parts.query else "" )
+                conn = get_connection( parts.scheme, parts.netloc, timeout )
+                conn.request( "GET", target )
+                response = conn.getresponse()
+                body = response.read()
+                if response.will_close:
+                    drop_connection( parts.scheme, parts.netloc )
+                if response.status not in REDIRECT_STATUS or not response.getheader( "Location" ):
+                    break
+                location = urljoin( location, response.getheader( "Location" ) )
+        except ( OSError, http.client.HTTPException ) as e:
+            drop_connection( parts.scheme, parts.netloc )
+            error = str( e ) or type( e ).__name__
+            continue
+        if response.status != 200:
+            error = "HTTP %d %s" % ( response.status, response.reason )
+            if response.status in RETRY_STATUS:
+                continue
+            return error, None, None
+        if validate and not is_complete( body, fmt, compressed ):
+            error = "truncated download"
+            continue
+
+        if compress:
+            body = gzip.compress( body )
+
+        # write to a temporary file first, then atomically move it in place
+        fd, tmp_file = tempfile.mkstemp( dir = os.path.dirname( path ) or ".", suffix = ".part" )
+        try:
+            with os.fdopen( fd, "wb" ) as f:
+                f.write( body )
+            os.replace( tmp_file, path )
+        except OSError as e:
+            if os.path.exists( tmp_file ):
+                os.remove( tmp_file )
+            return str( e ), None, None
+        return None, len( body ), hashlib.sha256( body ).hexdigest()
+    return error, None, None
+
+
+def download_all( jobs, entries, retries = 3, verbose = False, fmt = "pdb", validate = True,
+                  manifest = None ):
+    """
+    Downloads (four-letter ID, URL, path, compress) entries concurrently with a pool of threads,
+    journaling each outcome in the manifest, if given, as soon as it is known.
+
+    Returns a list of (four-letter ID, message) for the downloads that failed.
+    """
+    failures = []
+    with ThreadPoolExecutor( max_workers = jobs ) as executor:
+        futures = { executor.submit( fetch, url, pdb_file, retries, compress = compress, fmt = fmt,
+                                     validate = validate ): ( four_letter, pdb_file )
+                    for four_letter, url, pdb_file, compress in entries }
+        for future in as_completed( futures ):
+            four_letter, pdb_file = futures[future]
+            error, size, checksum = future.result()
+            if verbose:
+                print( pdb_file + ( " downloaded" if error is None else " failed: " + error ) )
+            if error is not None:
+                failures.append( ( four_letter, error ) )
+            if manifest is not None:
+                manifest.record( four_letter, pdb_file, "done" if error is None else "failed", size,
+                                 checksum, error )
+    return failures
+
+
+def split_chains( pdb_file, chains, fmt = "pdb", fast_reader = False ):
+    """
+    Parses an entry once and writes each of the requested chains of its first model to its own file.
+
+    chains maps chain IDs to the files to write them to. Returns a list of (chain ID, message) for
+    the chains that could not be written.
+    """
+    failed = []
+    if not os.path.exists( pdb_file ):
+        return [ ( chain_id, pdb_file + " was not downloaded" ) for chain_id in chains ]
+
+    if fast_reader and fmt == "pdb":
+        atoms = structure_cache.load_atoms( pdb_file )
+        atoms = atoms.select( atoms.model == 0 )
+        for chain_id, chain_file in chains.items():
+            chain = atoms.select( atoms.chain == chain_id.encode() )
+            if len( chain ) == 0:
+                failed.append( ( chain_id, "No chain " + chain_id + " was found in " + pdb_file ) )
+                continue
+            pdb_reader.write_atoms( chain, chain_file )
+        return failed
+
+    structure = pdb_reader.parse_structure( pdb_file, os.path.basename( pdb_file )[:4] )
+    pdb_writer = MMCIFIO() if fmt == "cif" else PDBIO()
+    for chain_id, chain_file in chains.items():
+        try:
+            chain = structure[0][chain_id]
+        except KeyError:
+            failed.append( ( chain_id, "No chain " + chain_id + " was found in " + pdb_file ) )
+            continue
+        pdb_writer.set_structure( chain )
+        pdb_writer.save( chain_file )
+    return failed
+
+
+def extract_chains( pdb_ids, pdb_dir, suffix, fmt = "pdb", fast_reader = False, jobs = None, verbose = False ):
+    """
+    Extracts the chains named by five-letter PDB IDs from the downloaded entries, in a pool of
+    worker processes with one task per entry.
+
+    Returns a list of (PDB ID, message) for the chains that could not be extracted.
+    """
+    # group the requested chains by entry, so that each entry is parsed only once
+    entries = {}
+    for pdb_id in pdb_ids:
+        four_letter = pdb_id[:4].lower()
+        mid_letters = pdb_id[1:3].lower()
+        pdb_file = pdb_dir + "/" + mid_letters + "/" + four_letter + suffix
+        chain_id = pdb_id[-1]
+        chain_file = pdb_dir + four_letter + chain_id + "." + fmt
+        if os.path.exists( chain_file ):
+            if verbose:
+                print( chain_file + " already exists, skip ..." )
+            continue
+        chains = entries.setdefault( ( four_letter, pdb_file ), {} )
+        chains[chain_id] = chain_file
+
+    # split the entries into chains in a pool of worker processes
+    chain_failures = []
+    with ProcessPoolExecutor( max_workers = jobs ) as executor:
+        futures = [ executor.submit( split_chains, pdb_file, chains, fmt, fast_reader )
+                    for ( four_letter, pdb_file ), chains in entries.items() ]
+        for ( ( four_letter, pdb_file ), chains ), future in zip( entries.items(), futures ):
+            try:
+                failed = future.result()
+            except Exception as e:
+                failed = [ ( chain_id, "could not read " + pdb_file + ": " + str( e ) ) for chain_id in chains ]
+            chain_failures += [ ( four_letter + chain_id, error ) for chain_id, error in failed ]
+    print( sum( len( c ) for c in entries.values() ) - len( chain_failures ), "chains written" )
+    for pdb_id, error in chain_failures:
+        print( "Failed to extract " + pdb_id + ": " + error )
+    return chain_failures
+
 
 def main():
     """
@@ -24,6 +310,26 @@ def main():
                          help = "path to the directory where to store the PDB files" )
     parser.add_argument( "-b", "--database", dest = "db",
                          help = "name of the protein structure database from which to download files" )
+    parser.add_argument( "-u", "--base-url", dest = "base_url",
+                         help = "download from this URL instead of the database's, e.g. a local mirror" )
+    parser.add_argument( "-z", "--gzip", dest = "gzip", action = "store_true",
+                         help = "download and store gzip-compressed entries (.gz)" )
+    parser.add_argument( "-f", "--format", dest = "format", choices = [ "pdb", "cif" ], default = "pdb",
+                         help = "file format of the entries, mmCIF for assemblies too large for PDB format" )
+    parser.add_argument( "-j", "--jobs", dest = "jobs", type = int, default = 8,
+                         help = "number of concurrent downloads and of chain splitting processes" )
+    parser.add_argument( "-r", "--retries", dest = "retries", type = int, default = 3,
+                         help = "number of times to retry a failed download" )
+    parser.add_argument( "-m", "--manifest", dest = "manifest",
+                         help = "journal of completed downloads, defaults to manifest.jsonl in the directory" )
+    parser.add_argument( "--verify", dest = "verify", action = "store_true",
+                         help = "re-check the checksums of entries the manifest lists as complete" )
+    parser.add_argument( "--no-validate", dest = "validate", action = "store_false",
+                         help = "do not require entries to end with an END record (or # for mmCIF)" )
+    parser.add_argument( "-e", "--report", dest = "report",
+                         help = "a file in which to list the entries and chains that failed, tab separated" )
+    parser.add_argument( "--fast-reader", dest = "fast_reader", action = "store_true",
+                         help = "split chains with the fast fixed-column PDB reader and structure cache" )
     parser.add_argument( "-v", "--verbose", dest = "verbose", action = "store_true",
                          help = "print details while downloading" )
     args = parser.parse_args()
@@ -37,45 +343,88 @@ def main():
     with open( args.list, "rt" ) as f:
         pdb_ids = f.read().splitlines()
 
-    # retrieve PDB files and extract essential headers
-    pdbl = PDBList()
+    # collect the entries that still need to be downloaded, each one only once
+    suffix = "." + args.format + ( ".gz" if args.gzip else "" )
+    base_url = args.base_url
+    if base_url is not None and not base_url.endswith( "/" ):
+        base_url += "/"
+    manifest_file = args.manifest or os.path.join( args.dir, "manifest.jsonl" )
+    os.makedirs( os.path.dirname( manifest_file ) or ".", exist_ok = True )
+    manifest = Manifest( manifest_file )
+    pending = {}
+    listed = set()
+    num_complete = num_found = 0
     for pdb_id in pdb_ids:
         four_letter = pdb_id[:4].lower()
         mid_letters = pdb_id[1:3].lower()
-        
+        if four_letter in listed:
+            continue
+        listed.add( four_letter )
+        pdb_file = args.dir + "/" + mid_letters + "/" + four_letter + suffix
+
+        # entries the manifest lists as complete are not looked at again
+        record = manifest.get( four_letter )
+        if record is not None and record["status"] == "done" and record["path"] == pdb_file:
+            if not args.verify:
+                num_complete += 1
+                continue
+            if os.path.exists( pdb_file ):
+                complete, size, checksum = check_file( pdb_file, args.format, args.validate )
+                if complete and checksum == record["sha256"]:
+                    num_complete += 1
+                    continue
+            print( pdb_file, "does not match its checksum in the manifest, download again ..." )
+
+        # files on disk that the manifest does not know about yet are validated once
+        elif os.path.exists( pdb_file ):
+            complete, size, checksum = check_file( pdb_file, args.format, args.validate )
+            if complete:
+                manifest.record( four_letter, pdb_file, "done", size, checksum )
+                num_found += 1
+                continue
+            print( pdb_file, "is truncated, download again ..." )
+
         # create dir if not exists
-        if not os.path.exists( args.dir + "/" + mid_letters ):
-            os.mkdir( args.dir + "/" + mid_letters )
-        
-        # retrieve current PDB file and store it under a directory tree
-        pdb_file = args.dir + "/" + mid_letters + "/" + four_letter + ".pdb"
-        if not os.path.exists( pdb_file ) or os.stat( pdb_file ).st_size == 0:
-            print(args.db)
-            if args.db == "OPM":
-                curl_pdb = "curl http://opm.phar.umich.edu/pdb/" + four_letter + ".pdb -o " + pdb_file 
-            else: 
-                curl_pdb = "curl https://files.rcsb.org/view/" + four_letter + ".pdb -o " + pdb_file 
-            os.system( curl_pdb )
-        else:
-            print( pdb_file, "already exists and is not empty, skip ..." )
+        os.makedirs( args.dir + "/" + mid_letters, exist_ok = True )
+        url, compress = entry_url( args.db, base_url, four_letter, args.format, args.gzip )
+        pending[four_letter] = ( four_letter, url, pdb_file, compress )
 
-        # if given PDB IDs are actually chains, then get the chain
-        if args.chains:
-            chain_id = pdb_id[-1]
-            chain_file = args.dir + four_letter + chain_id + ".pdb"
-            if os.path.exists( chain_file ):
-                print( chain_file + " already exists, skip ..." )
-            else:
-                pdb_parser = PDBParser( PERMISSIVE = 1 )
-                structure = pdb_parser.get_structure( four_letter, pdb_file )
-                try:
-                    chain = structure[0][chain_id]
-                except KeyError:
-                    print("No chain " + chain_id + " was found in " + pdb_file)
-                    sys.exit(1) 
-                pdb_writer = PDBIO()
-                pdb_writer.set_structure( chain )
-                pdb_writer.save( chain_file )
+    # download them concurrently
+    failures = download_all( args.jobs, sorted( pending.values() ), args.retries, args.verbose,
+                             args.format, args.validate, manifest )
+    manifest.close()
+    for four_letter, error in failures:
+        print( "Failed to download " + four_letter + ": " + error )
+
+    # split out the chains if given PDB IDs are actually chains
+    chain_failures = []
+    if args.chains:
+        chain_failures = extract_chains( pdb_ids, args.dir, suffix, args.format, args.fast_reader,
+                                         args.jobs, args.verbose )
+
+    # print a summary
+    print( "Summary" )
+    print( "  entries listed:            %d" % len( listed ) )
+    print( "  complete in the manifest:  %d" % num_complete )
+    print( "  complete on disk:          %d" % num_found )
+    print( "  downloaded:                %d" % ( len( pending ) - len( failures ) ) )
+    print( "  failed to download:        %d" % len( failures ) )
+    if args.chains:
+        print( "  chains failed to extract:  %d" % len( chain_failures ) )
+
+    # report what failed instead of stopping at the first failure
+    if args.report is not None:
+        with open( args.report, "wt" ) as f:
+            for pdb_id, error in failures:
+                f.write( pdb_id + "\tdownload\t" + error + "\n" )
+            for pdb_id, error in chain_failures:
+                f.write( pdb_id + "\tchain\t" + error + "\n" )
+
+    # let scripts and batch jobs tell that something went wrong
+    if failures:
+        raise SystemExit( "%d of %d entries failed to download." % ( len( failures ), len( pending ) ) )
+    if chain_failures:
+        raise SystemExit( "%d chains failed to extract." % len( chain_failures ) )
 
 
 if __name__ == "__main__":
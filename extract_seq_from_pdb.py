@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
 # import required modules
-from Bio import PDB, SeqIO, SeqRecord, pairwise2
+from Bio import PDB, Seq, SeqIO, SeqRecord
 from argparse import ArgumentParser
 from os.path import basename
+import alignment_cache
+import pdb_reader
+import sequence_aligner
+import structure_cache
 
 
 def main():
@@ -19,6 +23,8 @@ def main():
         help='residue seq number in the PDB file')
     parser.add_argument('-i', '--interactive', dest='interactive', 
         action='store_true', help='select sequenceinteractively')
+    parser.add_argument('--fast-reader', dest='fast_reader', action='store_true',
+        help='read coordinates with the fast fixed-column PDB reader and structure cache')
     args = parser.parse_args()
     
     print( "input file:          " + args.pdb)
@@ -27,20 +33,34 @@ def main():
     
     # extract sequences from SEQRES records
     pdb_id = basename(args.pdb).split('.')[0]
-    with open(args.pdb, 'rt') as f:
-        seqres_sequences = list(SeqIO.parse(f, 'pdb-seqres'))
+    seqres_format = 'cif-seqres' if pdb_reader.is_mmcif(args.pdb) else 'pdb-seqres'
+    with pdb_reader.open_text(args.pdb) as f:
+        seqres_sequences = list(SeqIO.parse(f, seqres_format))
     
     # extract sequences from residues with resolved coordinates
-    structure = PDB.PDBParser().get_structure(id=pdb_id, file=args.pdb)
-    model = structure[0]
-    peptide_builder = PDB.Polypeptide.PPBuilder()
+    if args.fast_reader:
+        atoms = structure_cache.load_atoms(args.pdb)
+        atoms = atoms.select((atoms.model == 0) & pdb_reader.amino_acids(atoms))
+    else:
+        structure = pdb_reader.parse_structure(args.pdb, pdb_id)
+        model = structure[0]
+        peptide_builder = PDB.Polypeptide.PPBuilder()
     sequences = []
     resseq_ids = []
     for c in args.chains:
-        residues = [r for r in model[c].get_residues() if PDB.is_aa(r)]
-        resseq_ids.append(r.get_id()[1] for r in residues)
-        chain = peptide_builder.build_peptides(model[c])
-        coord_sequence = chain[0].get_sequence()
+        if args.fast_reader:
+            chain_atoms = atoms.select(atoms.chain == c.encode())
+            resseq_ids.append(chain_atoms.resseq[chain_atoms.residue_starts()])
+            coord_sequence = Seq.Seq(pdb_reader.chain_sequence(atoms, c))
+        else:
+            residues = [r for r in model[c].get_residues() if PDB.is_aa(r)]
+            resseq_ids.append(r.get_id()[1] for r in residues)
+            # join the peptides on either side of each chain break, as the
+            # fast reader does; only single residues isolated between two
+            # breaks, which PPBuilder drops, still tell the two apart
+            peptides = peptide_builder.build_peptides(model[c])
+            coord_sequence = Seq.Seq(''.join(str(pp.get_sequence())
+                                             for pp in peptides))
         print('Sequence for chain ' + c + ' extracted from coordinates:')
         print(coord_sequence, '\n')
         # if the SEQRES records are missing from the PDB file, use sequence from coordinates
@@ -55,8 +75,8 @@ def main():
                     print(record.seq, '\n')
             # pairwise alignment between the two sequences
             print('Here is an alignment of the two sequences:')
-            alignment = pairwise2.align.globalms(coord_sequence, record.seq, 1, -0.5, -10, 0)
-            print(pairwise2.format_alignment(*alignment[0]))
+            alignment = alignment_cache.align(coord_sequence, record.seq)
+            print(sequence_aligner.format_alignment(*alignment))
             
 
             if args.interactive:
@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 
 import re
-import csv
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser
+import numpy as np
 
 
 GRANTHAM_SCORES = { 
@@ -409,35 +417,339 @@ GRANTHAM_SCORES = {
 }
 
 
+# the table compiled for scoring whole arrays of residues at once
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+GRANTHAM_MATRIX = np.array(
+    [[int(GRANTHAM_SCORES[(a, b)]) for b in AMINO_ACIDS] for a in AMINO_ACIDS],
+    dtype='int16'
+)
+
+# index into AMINO_ACIDS of every byte value, -1 for bytes that are not an
+# amino acid; lower case letters are looked up as upper case
+AA_INDEX = np.full(256, -1, dtype='int8')
+for i, aa in enumerate(AMINO_ACIDS):
+    AA_INDEX[ord(aa)] = AA_INDEX[ord(aa.lower())] = i
+
+# separators between the two residues of a pair
+SEPARATORS = np.frombuffer(b' \t,:;', dtype='uint8')
+
+# each output row, e.g. 'A,C,195\r\n', as bytes padded to a fixed width, one
+# row per pair of residue indices (20 * a + b)
+OUTPUT_ROWS = [
+    ('%s,%s,%d\r\n' % (a, b, GRANTHAM_MATRIX[i, j])).encode()
+    for i, a in enumerate(AMINO_ACIDS) for j, b in enumerate(AMINO_ACIDS)
+]
+ROW_LENGTHS = np.array([len(r) for r in OUTPUT_ROWS])
+ROW_BYTES = np.array([list(r.ljust(ROW_LENGTHS.max())) for r in OUTPUT_ROWS],
+                     dtype='uint8')
+
+CHUNK_SIZE = 2**24
+
+
+def parse_pairs(chunk, first_line=1):
+    """
+    Encodes the amino acid pairs in a block of whole lines.
+
+    Lines of the form 'A C', 'A,C', 'A:C' or 'A;C' are decoded as arrays;
+    any other line is split with a regular expression as before.
+
+    Parameters
+    ----------
+    chunk : bytes
+        Lines of amino acid pairs, ending with a newline.
+    first_line : int
+        Line number of the first line in the chunk, for error messages.
+
+    Returns
+    -------
+    tuple
+        Indices into AMINO_ACIDS of the first and second residue of each
+        pair, as int8 arrays.
+    """
+    buf = np.frombuffer(chunk, dtype='uint8')
+    ends = np.flatnonzero(buf == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts
+    lengths -= (lengths > 0) & (buf[ends - 1] == ord('\r'))
+
+    # decode the common one-letter, one-separator lines as arrays
+    simple = (lengths == 3) & np.isin(buf[np.minimum(starts + 1, ends)],
+                                      SEPARATORS)
+    a = np.where(simple, buf[starts], 0)
+    b = np.where(simple, buf[np.minimum(starts + 2, ends)], 0)
+
+    # and everything else line by line
+    keep = np.ones(len(starts), dtype=bool)
+    for k in np.flatnonzero(~simple):
+        line = chunk[starts[k]:ends[k]].decode().strip()
+        if not line:
+            keep[k] = False
+            continue
+        aa_pair = re.split(r'[\s+,:;]', line)
+        if len(aa_pair) > 1 and len(aa_pair[0]) == 1 and len(aa_pair[1]) == 1:
+            a[k], b[k] = ord(aa_pair[0]), ord(aa_pair[1])
+
+    index_a, index_b = AA_INDEX[a], AA_INDEX[b]
+    unknown = keep & ((index_a < 0) | (index_b < 0))
+    if unknown.any():
+        k = np.flatnonzero(unknown)[0]
+        raise ValueError('Not a pair of amino acids on line %d: %r' % (
+            first_line + k, chunk[starts[k]:ends[k]].decode()))
+    return index_a[keep], index_b[keep]
+
+
+def grantham_scores(index_a, index_b):
+    """
+    Grantham scores of arrays of residue indices, see parse_pairs.
+    """
+    return GRANTHAM_MATRIX[index_a, index_b]
+
+
+def format_scores(index_a, index_b, row_bytes=ROW_BYTES,
+                  row_lengths=ROW_LENGTHS):
+    """
+    CSV rows of residue pairs and their Grantham scores, as bytes. Other
+    scores can be written by passing another table of padded rows.
+    """
+    pairs = 20 * index_a.astype('int16') + index_b
+    mask = np.arange(row_bytes.shape[1]) < row_lengths[pairs][:, np.newaxis]
+    return row_bytes[pairs][mask].tobytes()
+
+
+def iter_chunks(in_f, chunk_size=CHUNK_SIZE, size=None):
+    """
+    Reads a binary file object about chunk_size bytes at a time, and at most
+    size bytes if given, in chunks of whole lines.
+
+    Yields
+    ------
+    tuple
+        A chunk, ending with a newline, and the number of its first line.
+    """
+    line_number = 1
+    remainder = b''
+    while True:
+        if size is not None:
+            block = in_f.read(min(chunk_size, size))
+            size -= len(block)
+        else:
+            block = in_f.read(chunk_size)
+        if not block:
+            chunk, remainder = remainder, b''
+        else:
+            # carry over the last partial line to the next chunk
+            remainder += block
+            cut = remainder.rfind(b'\n') + 1
+            if not cut:
+                continue
+            chunk, remainder = remainder[:cut], remainder[cut:]
+        if not chunk:
+            break
+        if not chunk.endswith(b'\n'):
+            chunk += b'\n'
+        yield chunk, line_number
+        line_number += chunk.count(b'\n')
+
+
+def score_chunk(chunk, first_line=1, row_bytes=ROW_BYTES,
+                row_lengths=ROW_LENGTHS):
+    """
+    Output rows of the amino acid pairs in a chunk of whole lines.
+    """
+    index_a, index_b = parse_pairs(chunk, first_line)
+    return format_scores(index_a, index_b, row_bytes, row_lengths)
+
+
+def score_file(in_f, out_f, chunk_size=CHUNK_SIZE, row_bytes=ROW_BYTES,
+               row_lengths=ROW_LENGTHS):
+    """
+    Scores every amino acid pair in a binary file object and writes the
+    rows to another, reading about chunk_size bytes at a time.
+    """
+    for chunk, first_line in iter_chunks(in_f, chunk_size):
+        out_f.write(score_chunk(chunk, first_line, row_bytes, row_lengths))
+
+
+def shard_ranges(path, num_shards):
+    """
+    Splits a file into about equal byte ranges that start and end on line
+    boundaries.
+
+    Returns
+    -------
+    list
+        (start, end) byte offsets of the non-empty ranges, in order.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as in_f:
+        for i in range(1, num_shards):
+            # move to the start of the line following the split point
+            in_f.seek(max(size * i // num_shards - 1, bounds[-1]))
+            in_f.readline()
+            bounds.append(min(max(in_f.tell(), bounds[-1]), size))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def score_range(path, start, end, out_path, compress=False,
+                chunk_size=CHUNK_SIZE, row_bytes=ROW_BYTES,
+                row_lengths=ROW_LENGTHS):
+    """
+    Scores the pairs in a byte range of an uncompressed file in a worker
+    process and writes the rows to out_path, as a gzip member if compress is
+    set.
+    """
+    opener = gzip.open if compress else open
+    with open(path, 'rb') as in_f, opener(out_path, 'wb') as out_f:
+        in_f.seek(start)
+        try:
+            for chunk, first_line in iter_chunks(in_f, chunk_size, end - start):
+                out_f.write(score_chunk(chunk, first_line, row_bytes,
+                                        row_lengths))
+        except ValueError as e:
+            raise ValueError('%s, counting lines from byte %d' % (e, start))
+
+
+def score_parallel(input_path, output_path, jobs, compress=False,
+                   chunk_size=CHUNK_SIZE, row_bytes=ROW_BYTES,
+                   row_lengths=ROW_LENGTHS, header=b''):
+    """
+    Scores the pairs in input_path with a pool of worker processes and
+    writes the rows, after header, to output_path in input order ('-' for
+    standard input or output).
+
+    An uncompressed input file is split into one byte range per worker; each
+    worker reads its own range and writes a temporary file, and the files
+    are concatenated at the end. As concatenated gzip members are a valid
+    gzip file, compressed output is also written by the workers. Other
+    input is read here and its chunks are scored by the workers in turn.
+    """
+    compress = compress or output_path.endswith('.gz')
+    seekable = input_path != '-' and os.path.isfile(input_path)
+    if seekable:
+        with open(input_path, 'rb') as in_f:
+            seekable = in_f.read(2) != b'\x1f\x8b'
+
+    if not seekable:
+        with open_input(input_path) as in_f:
+            with open_output(output_path, compress) as out_f:
+                out_f.write(header)
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    # keep a bounded number of chunks in flight, in order
+                    pending = deque()
+                    for chunk, first_line in iter_chunks(in_f, chunk_size):
+                        pending.append(executor.submit(
+                            score_chunk, chunk, first_line, row_bytes,
+                            row_lengths))
+                        if len(pending) >= 2 * jobs:
+                            out_f.write(pending.popleft().result())
+                    while pending:
+                        out_f.write(pending.popleft().result())
+        return
+
+    ranges = shard_ranges(input_path, jobs)
+    tmp_parent = None
+    if output_path != '-':
+        tmp_parent = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=tmp_parent) as tmp_dir:
+        shard_files = [os.path.join(tmp_dir, 'shard%d' % i)
+                       for i in range(len(ranges))]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(score_range, input_path, start, end, shard_file,
+                                compress, chunk_size, row_bytes, row_lengths)
+                for (start, end), shard_file in zip(ranges, shard_files)
+            ]
+            for future in futures:
+                future.result()
+
+        # the shards are already compressed, concatenate them as they are
+        if output_path == '-':
+            output = nullcontext(sys.stdout.buffer)
+        else:
+            output = open(output_path, 'wb')
+        with output as out_f:
+            if header:
+                out_f.write(gzip.compress(header) if compress else header)
+            for shard_file in shard_files:
+                with open(shard_file, 'rb') as in_f:
+                    shutil.copyfileobj(in_f, out_f, 2**20)
+
+
+def open_input(path):
+    """
+    Opens an input file, or standard input for '-', in binary mode.
+    gzip-compressed input is recognized by its magic number, so compressed
+    data may also be piped in.
+    """
+    if path == '-':
+        stream = nullcontext(sys.stdin.buffer)
+        is_gzip = sys.stdin.buffer.peek(2)[:2] == b'\x1f\x8b'
+    else:
+        stream = open(path, 'rb')
+        is_gzip = stream.peek(2)[:2] == b'\x1f\x8b'
+        if is_gzip:
+            stream.close()
+            return gzip.open(path, 'rb')
+    return gzip.GzipFile(fileobj=sys.stdin.buffer, mode='rb') if is_gzip else stream
+
+
+def open_output(path, compress=False):
+    """
+    Opens an output file, or standard output for '-', in binary mode. The
+    output is gzip-compressed if compress is set or path ends with .gz.
+    """
+    if path == '-':
+        if compress:
+            return gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb',
+                                 compresslevel=6)
+        return nullcontext(sys.stdout.buffer)
+    if compress or path.endswith('.gz'):
+        return gzip.open(path, 'wb', compresslevel=6)
+    return open(path, 'wb')
+
+
 def main():
     arg_parser = ArgumentParser()
     arg_parser.add_argument(
-        '-i', '--input', dest='input', type=str, required=True,
+        '-i', '--input', dest='input', type=str, default='-',
         help='''A file containing a list of amino acid pairs. One pair per 
-        line, separated by space(s) or comma, or colon or semicolon.'''
+        line, separated by space(s) or comma, or colon or semicolon. May be
+        gzip-compressed. Defaults to standard input.'''
     )
     arg_parser.add_argument(
-        '-o', '--output', dest='output', type=str, required=False,
+        '-o', '--output', dest='output', type=str, default='-',
         help='''Output file with the Grantham scores for all amino acid 
-        pairs.'''
+        pairs, gzip-compressed if its name ends with .gz. Defaults to standard
+        output.'''
+    )
+    arg_parser.add_argument(
+        '-z', '--gzip', dest='gzip', action='store_true',
+        help='''Compress the output with gzip.'''
+    )
+    arg_parser.add_argument(
+        '--chunk-size', dest='chunk_size', type=float, default=16,
+        help='''Megabytes of input to read, score and write at a time, which
+        bounds memory use. Default 16.'''
+    )
+    arg_parser.add_argument(
+        '-j', '--jobs', dest='jobs', type=int, default=1,
+        help='''Number of worker processes. Uncompressed input files are
+        split into one byte range per worker.'''
     )
     cmd_args = arg_parser.parse_args()
     
-    # parse amino acid pairs
-    with open(cmd_args.input, 'rt') as in_f:
-        aa_pairs = [re.split('[\s+,:;]', l.strip()) for l in in_f]
-        
-    # retrieve Grantham scores
-    grantham_scores = []
-    for aa_pair in aa_pairs:
-        a = aa_pair[0].upper()
-        b = aa_pair[1].upper()
-        grantham_scores.append((a, b, GRANTHAM_SCORES[(a, b)]))
-        
-    # write scores to disk file
-    with open(cmd_args.output, 'wt') as out_f:
-        csv_writer = csv.writer(out_f)
-        csv_writer.writerows(grantham_scores)
+    # parse amino acid pairs, retrieve their Grantham scores and write them
+    # out a chunk at a time
+    chunk_size = max(int(cmd_args.chunk_size * 2**20), 1)
+    if cmd_args.jobs > 1:
+        score_parallel(cmd_args.input, cmd_args.output, cmd_args.jobs,
+                       cmd_args.gzip, chunk_size)
+        return
+    with open_input(cmd_args.input) as in_f:
+        with open_output(cmd_args.output, cmd_args.gzip) as out_f:
+            score_file(in_f, out_f, chunk_size)
         
 
 if __name__ == '__main__':
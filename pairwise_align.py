@@ -4,13 +4,27 @@
 This script reads in a fasta file containing two records and does pairwise
 alignment on them using the identidy matrix. -10 points are deducted from
 opening a gap.
+
+In batch mode, many pairs of records from two multi-fasta files are aligned
+in a pool of worker processes. The alignments are written to one fasta file
+and an index next to it lists, for each pair, the score, the number of
+mismatches, whether the alignment looks suspicious and the byte offset of
+the alignment in the fasta file.
 """
 
 # imports from the standard library
+import os
+import tempfile
 from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, zip_longest
 # imports from external libraries
-from Bio import pairwise2, Seq, SeqIO, SeqRecord, Align, AlignIO
+from Bio import Seq, SeqIO, SeqRecord, Align, AlignIO
 from Bio.Alphabet import IUPAC
+# imports from this repository
+import alignment_cache
+import sequence_aligner
 
 
 def count_mismatches(seq_a, seq_b):
@@ -36,6 +50,164 @@ def count_mismatches(seq_a, seq_b):
     return count
 
 
+def is_suspicious(aligned_a, aligned_b):
+    """
+    Whether the alignment has mismatches at 10% or more of the positions of
+    the second sequence, e.g. a UniProt sequence aligned to a PDB sequence.
+    """
+    return count_mismatches(aligned_a, aligned_b) >= 0.1 * len(aligned_b)
+
+
+def align_pairs(pairs, backend=sequence_aligner.DEFAULT_BACKEND):
+    """
+    Aligns (sequence a, sequence b) pairs in a worker process.
+
+    Returns
+    -------
+    list
+        For each pair, the two aligned sequences, the score, the number of
+        mismatches and whether the alignment is suspicious.
+    """
+    results = []
+    for seq_a, seq_b in pairs:
+        aligned_a, aligned_b, score = alignment_cache.align(seq_a, seq_b,
+                                                            backend)
+        results.append((aligned_a, aligned_b, score,
+                        count_mismatches(aligned_a, aligned_b),
+                        is_suspicious(aligned_a, aligned_b)))
+    return results
+
+
+def read_pairs(fasta_a, fasta_b, pair_list=None):
+    """
+    Pairs of records to align in batch mode.
+
+    Parameters
+    ----------
+    fasta_a, fasta_b : str
+        Multi-fasta files.
+    pair_list : str
+        A file with the IDs of a record in fasta_a and of one in fasta_b on
+        each line. Without it, records are paired in the order of the files.
+
+    Yields
+    ------
+    tuple
+        A record from fasta_a and one from fasta_b.
+
+    Raises
+    ------
+    ValueError
+        If records are paired in order and one file has more records than
+        the other, or if the pair list names a record that is not in its
+        file.
+    """
+    if pair_list is None:
+        records_a = SeqIO.parse(fasta_a, 'fasta')
+        records_b = SeqIO.parse(fasta_b, 'fasta')
+        for record_a, record_b in zip_longest(records_a, records_b):
+            if record_a is None or record_b is None:
+                raise ValueError(
+                    '%s and %s hold different numbers of records, the '
+                    'records from %s on are not paired.' % (
+                        fasta_a, fasta_b, (record_a or record_b).id))
+            yield record_a, record_b
+        return
+    records_a = SeqIO.index(fasta_a, 'fasta')
+    records_b = SeqIO.index(fasta_b, 'fasta')
+    # check every ID before the first pair is aligned
+    id_pairs = []
+    with open(pair_list, 'rt') as ipf:
+        for line_number, l in enumerate(ipf, 1):
+            if not l.strip() or l.startswith('#'):
+                continue
+            id_a, id_b = l.split()[:2]
+            for record_id, records, fasta in ((id_a, records_a, fasta_a),
+                                              (id_b, records_b, fasta_b)):
+                if record_id not in records:
+                    raise ValueError('%s, line %d: no record %s in %s.' % (
+                        pair_list, line_number, record_id, fasta))
+            id_pairs.append((id_a, id_b))
+    for id_a, id_b in id_pairs:
+        yield records_a[id_a], records_b[id_b]
+
+
+def run_batch(pairs, output, index, jobs=None,
+              backend=sequence_aligner.DEFAULT_BACKEND, chunk_size=16):
+    """
+    Aligns pairs of records in a pool of worker processes and streams the
+    alignments, in the order of the pairs, to a fasta file with an index.
+    Pairs are sent to the workers chunk_size at a time, with at most two
+    chunks per worker in flight, so pairs are only read as they are needed.
+
+    The alignments and the index are written to temporary files that replace
+    output and index only once every pair is aligned, so that a failure, e.g.
+    an unpaired record or an exception in a worker, leaves no half-written
+    output behind.
+
+    Returns
+    -------
+    tuple
+        The number of pairs aligned and of suspicious alignments.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    pairs = iter(pairs)
+    num_pairs = num_suspicious = 0
+    tmp_output = tmp_index = None
+    try:
+        output_fd, tmp_output = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(output)), suffix='.part')
+        index_fd, tmp_index = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(index)), suffix='.part')
+        # the output is written as bytes, so that the index gives byte offsets
+        with os.fdopen(output_fd, 'wb') as opf, \
+                os.fdopen(index_fd, 'wt') as idx, \
+                ProcessPoolExecutor(max_workers=jobs) as executor:
+            idx.write('#pair\tid_a\tid_b\tscore\tmismatches\tsuspicious\t'
+                      'offset\tlength\n')
+            # each chunk of records in flight and the future of its
+            # alignments
+            pending = deque()
+            while True:
+                chunk = list(islice(pairs, chunk_size))
+                if chunk:
+                    pending.append((chunk, executor.submit(
+                        align_pairs,
+                        [(str(a.seq), str(b.seq)) for a, b in chunk],
+                        backend)))
+                if not pending:
+                    break
+                if chunk and len(pending) < 2 * jobs:
+                    continue
+                chunk, future = pending.popleft()
+                for (record_a, record_b), result in zip(chunk,
+                                                        future.result()):
+                    (aligned_a, aligned_b, score, mismatches,
+                     suspicious) = result
+                    data = (
+                        SeqRecord.SeqRecord(
+                            Seq.Seq(aligned_a), id=record_a.id,
+                            description=record_a.description).format('fasta') +
+                        SeqRecord.SeqRecord(
+                            Seq.Seq(aligned_b), id=record_b.id,
+                            description=record_b.description).format('fasta')
+                    ).encode()
+                    offset = opf.tell()
+                    opf.write(data)
+                    idx.write('%d\t%s\t%s\t%g\t%d\t%d\t%d\t%d\n' % (
+                        num_pairs, record_a.id, record_b.id, score,
+                        mismatches, suspicious, offset, len(data)))
+                    num_pairs += 1
+                    num_suspicious += suspicious
+        os.replace(tmp_output, output)
+        os.replace(tmp_index, index)
+    finally:
+        for tmp_file in (tmp_output, tmp_index):
+            if tmp_file is not None and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    return num_pairs, num_suspicious
+
+
 def parse_cmd_arguments():
     # setting up
     parser = ArgumentParser()
@@ -45,6 +217,24 @@ def parse_cmd_arguments():
                         help='a fasta file containing the second sequence')
     parser.add_argument('-o', '--output', dest='output',
                         help='a name for the output fasta file')
+    parser.add_argument('--batch', dest='batch', action='store_true',
+                        help='align every record of the first file with the '
+                        'record at the same position in the second file')
+    parser.add_argument('-p', '--pairs', dest='pairs',
+                        help='a file with the IDs of a record of the first '
+                        'file and of one of the second file to align on each '
+                        'line, implies --batch')
+    parser.add_argument('-i', '--index', dest='index',
+                        help='index of the batch output, defaults to the '
+                        'output file name with .index appended')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='number of worker processes in batch mode, '
+                        'defaults to the number of CPUs')
+    parser.add_argument('--backend', dest='backend',
+                        default=sequence_aligner.DEFAULT_BACKEND,
+                        choices=list(sequence_aligner.BACKENDS),
+                        help='alignment backend, default %s' %
+                        sequence_aligner.DEFAULT_BACKEND)
     # do any checking on command-line arguments here, if necessary
     return parser.parse_args()
 
@@ -53,6 +243,22 @@ def main():
     # parse command-line arguments
     args = parse_cmd_arguments()
 
+    # align many pairs at once
+    if args.batch or args.pairs is not None:
+        index = args.index or args.output + '.index'
+        try:
+            num_pairs, num_suspicious = run_batch(
+                read_pairs(args.seq_a, args.seq_b, args.pairs), args.output,
+                index, args.jobs, args.backend)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(num_pairs, 'alignments written to', args.output, 'and indexed '
+              'in', index)
+        if num_suspicious:
+            print(num_suspicious, 'suspicious alignments between UniProt '
+                  'sequence and PDB sequence, please check the index')
+        return
+
     # parse amino acid sequences
     record_a = next(SeqIO.parse(args.seq_a, 'fasta', alphabet=IUPAC.protein))
     record_b = next(SeqIO.parse(args.seq_b, 'fasta', alphabet=IUPAC.protein))
@@ -64,25 +270,24 @@ def main():
     # now align the two given sequences
     print('Now aligning the two given sequences using global alignment and '
           'the identity matrix with -10 gap openning penalty ...')
-    alignments = pairwise2.align.globalms(record_a.seq, record_b.seq, 1, -0.5,
-                                          -10, 0)
+    alignment = alignment_cache.align(record_a.seq, record_b.seq,
+                                      args.backend)
     multiple_alignment = Align.MultipleSeqAlignment([
-        SeqRecord.SeqRecord(seq=Seq.Seq(alignments[0][0]), id=record_a.id,
+        SeqRecord.SeqRecord(seq=Seq.Seq(alignment[0]), id=record_a.id,
                             description=record_a.description),
-        SeqRecord.SeqRecord(seq=Seq.Seq(alignments[0][1]), id=record_b.id,
+        SeqRecord.SeqRecord(seq=Seq.Seq(alignment[1]), id=record_b.id,
                             description=record_b.description)
     ])
     AlignIO.write(multiple_alignment, args.output, 'fasta')
     print('The following alignment has been written to ' + args.output, '\n')
 
     # flag suspicious alignment
-    mismatches = count_mismatches(alignments[0][0], alignments[0][1])
-    if mismatches >= 0.1 * len(alignments[0][1]):
+    if is_suspicious(alignment[0], alignment[1]):
         print('Suspicious alignment between UniProt sequence and PDB sequence,'
               ' please check', args.output)
 
     # print the alignment
-    print(pairwise2.format_alignment(*alignments[0]))
+    print(sequence_aligner.format_alignment(*alignment))
 
 
 if __name__ == '__main__':
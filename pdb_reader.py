@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+
+"""
+A lightweight reader for the ATOM and HETATM records of PDB files.
+
+Records are sliced by their fixed columns into NumPy arrays, one array per
+field, instead of building Biopython's Structure/Model/Chain/Residue/Atom
+object tree. Scripts that only need coordinates, residue IDs and names can
+use it in place of Bio.PDB.PDBParser.
+
+Files may be gzip-compressed (.gz) and may be in mmCIF format (.cif), for
+entries too large for the PDB format. open_text and parse_structure give the
+same transparent handling to scripts that use Biopython's parsers.
+"""
+
+# imports from the standard library
+import gzip
+import re
+from argparse import ArgumentParser
+# imports from external libraries
+import numpy as np
+from Bio.Data.IUPACData import protein_letters_3to1
+try:
+    from Bio.Data.PDBData import protein_letters_3to1_extended
+except ImportError:  # older Biopython
+    from Bio.Data.SCOPData import \
+        protein_letters_3to1 as protein_letters_3to1_extended
+
+# version of the arrays read_atoms returns, part of the keys of the parsed
+# structure cache; bump it whenever they change so older entries are not used
+VERSION = 2
+
+# name, first column, last column + 1 and dtype of the fixed-width fields;
+# multi-character text fields are stripped, single characters are kept as is
+FIELDS = [
+    ('record_name', 0, 6, 'S6'),
+    ('name', 12, 16, 'S4'),
+    ('altloc', 16, 17, 'S1'),
+    ('resname', 17, 20, 'S3'),
+    ('chain', 21, 22, 'S1'),
+    ('resseq', 22, 26, 'int32'),
+    ('icode', 26, 27, 'S1'),
+    ('occupancy', 54, 60, 'float32'),
+    ('bfactor', 60, 66, 'float32'),
+    ('element', 76, 78, 'S2'),
+]
+
+# Atoms fields read from the columns of the mmCIF _atom_site category
+MMCIF_FIELDS = [
+    ('record_name', 'group_PDB', 'S6'),
+    ('name', 'auth_atom_id', 'S4'),
+    ('altloc', 'label_alt_id', 'S1'),
+    ('resname', 'auth_comp_id', 'S3'),
+    ('chain', 'auth_asym_id', 'S4'),
+    ('resseq', 'auth_seq_id', 'int32'),
+    ('icode', 'pdbx_PDB_ins_code', 'S1'),
+    ('occupancy', 'occupancy', 'float32'),
+    ('bfactor', 'B_iso_or_equiv', 'float32'),
+    ('element', 'type_symbol', 'S2'),
+]
+
+# a whitespace separated mmCIF token, possibly quoted
+MMCIF_TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+# one-letter codes of the standard amino acids keyed by residue name
+THREE_TO_ONE = {k.upper().encode(): v for k, v in protein_letters_3to1.items()}
+# the same for modified amino acids too, e.g. M for MSE, the residues
+# Bio.PDB.is_aa accepts with standard=False
+EXTENDED_THREE_TO_ONE = {k.upper().encode(): v for k, v in
+                         protein_letters_3to1_extended.items()}
+
+
+class Atoms:
+    """
+    Structure-of-arrays view of the atom records of a PDB file.
+
+    Every field in FIELDS is an attribute holding one array entry per atom,
+    together with coords, an (n_atoms, 3) float32 array, model, the 0-based
+    index of the model each atom belongs to, and records, the raw lines.
+    """
+    def __init__(self, **arrays):
+        self.fields = list(arrays)
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def select(self, mask):
+        """
+        A new Atoms holding only the atoms selected by the given boolean
+        mask or index array.
+        """
+        return Atoms(**{f: getattr(self, f)[mask] for f in self.fields})
+
+    def residue_starts(self):
+        """
+        Index of the first atom of each residue. A new residue starts
+        whenever the model, chain ID, residue sequence number or insertion
+        code changes from one atom to the next.
+        """
+        if len(self) == 0:
+            return np.zeros(0, dtype='int64')
+        changed = np.zeros(len(self), dtype='bool')
+        changed[0] = True
+        for f in ('model', 'chain', 'resseq', 'icode'):
+            values = getattr(self, f)
+            changed[1:] |= values[1:] != values[:-1]
+        return np.flatnonzero(changed)
+
+    def residue_labels(self, starts=None):
+        """
+        Chain ID, residue sequence number and insertion code of each
+        residue, e.g. A42 or B100A, in the same form as contact_map.
+        """
+        if starts is None:
+            starts = self.residue_starts()
+        return [(c + str(r) + i.strip()) for c, r, i in zip(
+            self.chain[starts].astype('U'), self.resseq[starts],
+            self.icode[starts].astype('U1'))]
+
+
+def is_mmcif(structure_file):
+    """
+    Whether the given file is in mmCIF format, judged by its extension.
+    """
+    return structure_file.lower().endswith(('.cif', '.cif.gz', '.mmcif',
+                                            '.mmcif.gz'))
+
+
+def open_text(structure_file, mode='rt'):
+    """
+    Opens a plain or gzip-compressed (.gz) file, decompressing on the fly.
+    """
+    if structure_file.endswith('.gz'):
+        return gzip.open(structure_file, mode)
+    return open(structure_file, mode)
+
+
+def parse_structure(structure_file, structure_id='pdb'):
+    """
+    Bio.PDB structure of a PDB or mmCIF file, plain or gzip-compressed.
+    """
+    from Bio.PDB import MMCIFParser, PDBParser
+    if is_mmcif(structure_file):
+        parser = MMCIFParser()
+    else:
+        parser = PDBParser(PERMISSIVE=1)
+    with open_text(structure_file) as handle:
+        return parser.get_structure(structure_id, handle)
+
+
+def read_atoms(pdb_file):
+    """
+    Reads all the ATOM and HETATM records of a PDB file.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to the PDB file, or mmCIF file, plain or gzip-compressed.
+
+    Returns
+    -------
+    Atoms
+        The atom records as arrays.
+    """
+    if is_mmcif(pdb_file):
+        return read_mmcif_atoms(pdb_file)
+    with open_text(pdb_file, 'rb') as ipf:
+        lines = ipf.read().splitlines()
+
+    # keep the atom records and remember which model each one belongs to
+    atom_lines = []
+    model_sizes = []
+    for l in lines:
+        if l.startswith((b'ATOM  ', b'HETATM')):
+            atom_lines.append(l)
+        elif l.startswith(b'ENDMDL'):
+            model_sizes.append(len(atom_lines))
+    model_sizes.append(len(atom_lines))
+    model = np.repeat(np.arange(len(model_sizes), dtype='int32'),
+                      np.diff(model_sizes, prepend=0))
+    return parse_records(atom_lines, model)
+
+
+def parse_records(atom_lines, model=None):
+    """
+    Slices ATOM/HETATM lines into arrays.
+
+    Parameters
+    ----------
+    atom_lines : list
+        Atom records as bytes.
+    model : numpy.ndarray
+        Model index of each record, all 0 if not given.
+
+    Returns
+    -------
+    Atoms
+        The atom records as arrays.
+    """
+    records = np.array(atom_lines, dtype='S80')
+    columns = records.view('S1').reshape(len(records), 80)
+    arrays = {}
+    for name, start, end, dtype in FIELDS:
+        field = columns[:, start:end].copy().view('S%d' % (end - start))
+        field = field.reshape(len(records))
+        if dtype.startswith('S'):
+            arrays[name] = field if end - start == 1 else np.char.strip(field)
+        else:
+            # optional numeric fields may be blank
+            arrays[name] = np.where(np.char.strip(field) == b'', b'0', field).astype(dtype)
+    coords = columns[:, 30:54].copy().view('S8').reshape(len(records), 3)
+    arrays['coords'] = coords.astype('float32')
+    if model is None:
+        model = np.zeros(len(records), dtype='int32')
+    arrays['model'] = model
+    arrays['records'] = records
+    return Atoms(**arrays)
+
+
+def read_mmcif_atoms(cif_file):
+    """
+    Reads the _atom_site loop of an mmCIF file into the same arrays as
+    read_atoms, using the author chain IDs and residue numbers. Chain IDs may
+    have up to four characters. The records field is left out since mmCIF
+    entries need not fit into PDB records.
+
+    Parameters
+    ----------
+    cif_file : str
+        Path to the mmCIF file, plain or gzip-compressed.
+
+    Returns
+    -------
+    Atoms
+        The atom records as arrays.
+    """
+    columns = []
+    tokens = []
+    in_loop = in_atom_site = False
+    with open_text(cif_file) as ipf:
+        for l in ipf:
+            if l.startswith('loop_'):
+                if in_atom_site:
+                    break
+                in_loop = True
+                continue
+            if l.startswith('_'):
+                if in_atom_site and tokens:
+                    break
+                if in_loop and l.startswith('_atom_site.'):
+                    in_atom_site = True
+                    columns.append(l.split()[0][len('_atom_site.'):])
+                elif in_atom_site:
+                    break
+                continue
+            if in_atom_site:
+                if l.startswith(('#', 'data_')):
+                    break
+                tokens.extend(m.group(m.lastindex)
+                              for m in MMCIF_TOKEN.finditer(l))
+
+    rows = np.array(tokens, dtype='S').reshape(-1, len(columns) or 1)
+    arrays = {}
+    for name, column, dtype in MMCIF_FIELDS:
+        if column not in columns:
+            column = column.replace('auth_', 'label_')
+        field = rows[:, columns.index(column)] if column in columns else \
+            np.full(len(rows), b'?')
+        # mmCIF writes missing values as ? or .
+        missing = (field == b'?') | (field == b'.')
+        if dtype.startswith('S'):
+            arrays[name] = np.where(missing, b' ', field).astype(dtype)
+        else:
+            arrays[name] = np.where(missing, b'0', field).astype(dtype)
+    arrays['coords'] = np.column_stack([
+        rows[:, columns.index('Cartn_' + a)] for a in 'xyz'
+    ]).astype('float32') if len(rows) else np.zeros((0, 3), dtype='float32')
+    if 'pdbx_PDB_model_num' in columns:
+        models = rows[:, columns.index('pdbx_PDB_model_num')]
+        _, first, model = np.unique(models, return_index=True,
+                                    return_inverse=True)
+        # number the models in the order they appear in the file
+        rank = np.empty(len(first), dtype='int32')
+        rank[np.argsort(first)] = np.arange(len(first))
+        arrays['model'] = rank[model.ravel()]
+    else:
+        arrays['model'] = np.zeros(len(rows), dtype='int32')
+    return Atoms(**arrays)
+
+
+def first_altloc(atoms):
+    """
+    Mask of the atoms to keep when only the first alternate location of each
+    atom is wanted: atoms without alternate locations and, for those with,
+    the location that comes first in the file.
+    """
+    keep = atoms.altloc == b' '
+    disordered = np.flatnonzero(~keep)
+    if len(disordered):
+        keys = np.rec.fromarrays([getattr(atoms, f)[disordered] for f in
+                                  ('model', 'chain', 'resseq', 'icode', 'name')])
+        _, first = np.unique(keys, return_index=True)
+        keep[disordered[first]] = True
+    return keep
+
+
+def amino_acids(atoms, standard=False):
+    """
+    Mask of the atoms that belong to amino acid residues, following
+    Bio.PDB.is_aa: standard residues only, or any residue name with a
+    one-letter code (e.g. MSE) if standard is False.
+    """
+    from Bio.PDB import is_aa
+    names = np.unique(atoms.resname)
+    accepted = [n for n in names if is_aa(n.decode(), standard=standard)]
+    return np.isin(atoms.resname, accepted)
+
+
+def chain_residues(atoms, chain_id, model=0, modified=False):
+    """
+    One-letter sequence of the standard amino acid residues with a CA atom in
+    the given chain of the given model, and the residue ID of each of them,
+    e.g. 42 or 100A, see chain_sequence. Modified amino acids, e.g. MSE, are
+    included too, with the one-letter code of their parent, if modified is
+    set.
+    """
+    table = EXTENDED_THREE_TO_ONE if modified else THREE_TO_ONE
+    selected = atoms.select((atoms.chain == chain_id.encode()) &
+                            (atoms.model == model) &
+                            np.isin(atoms.resname, list(table)))
+    starts = selected.residue_starts()
+    if len(starts) == 0:
+        return '', []
+    has_ca = np.add.reduceat((selected.name == b'CA').astype('int64'), starts) > 0
+    starts = starts[has_ca]
+    sequence = ''.join(table[n] for n in selected.resname[starts])
+    residue_ids = [str(r) + i.strip() for r, i in zip(
+        selected.resseq[starts], selected.icode[starts].astype('U1'))]
+    return sequence, residue_ids
+
+
+def chain_sequence(atoms, chain_id, model=0):
+    """
+    One-letter sequence of the standard amino acid residues with a CA atom in
+    the given chain of the given model. This is the sequence Bio.PDB's
+    PPBuilder would give for a chain without breaks; PPBuilder also drops
+    single residues isolated between two breaks.
+    """
+    return chain_residues(atoms, chain_id, model)[0]
+
+
+def write_atoms(atoms, pdb_file):
+    """
+    Writes the raw records of the given atoms followed by TER and END.
+    """
+    if 'records' not in atoms.fields:
+        raise ValueError('Atoms read from mmCIF have no PDB records to write.')
+    with open(pdb_file, 'wb') as opf:
+        for record in atoms.records:
+            opf.write(record + b'\n')
+        opf.write(b'TER\nEND\n')
+
+
+def main():
+    parser = ArgumentParser(description='Summarize the atom records of a PDB '
+                            'file read with the fast reader.')
+    parser.add_argument('-p', '--pdb', dest='pdb', required=True,
+                        help='input PDB file')
+    args = parser.parse_args()
+
+    atoms = read_atoms(args.pdb)
+    print('atoms:   ', len(atoms))
+    print('models:  ', len(np.unique(atoms.model)))
+    print('residues:', len(atoms.residue_starts()))
+    for chain_id in np.unique(atoms.chain):
+        print('chain ' + chain_id.decode() + ':',
+              chain_sequence(atoms, chain_id.decode()))
+
+
+if __name__ == '__main__':
+    main()
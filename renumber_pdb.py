@@ -1,40 +1,155 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import tempfile
 from argparse import ArgumentParser
-from Bio.PDB import PDBParser, PPBuilder
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from Bio.PDB import PPBuilder
 from Bio.Alphabet import ProteinAlphabet
 from Bio import Seq, SeqRecord, Align, AlignIO, SeqIO
-from Bio import pairwise2
+import alignment_cache
+import pdb_reader
+from residue_mapping import (UNMAPPED, INSERTION, create_id_mapping,
+                             mapping_array)
+import sequence_aligner
+import structure_cache
 
+# records that carry a chain ID and residue sequence number in columns 22-26
+RENUMBERED_RECORDS = ('ATOM  ', 'HETATM', 'ANISOU', 'SIGATM', 'SIGUIJ', 'TER')
 
-def get_chain_seq(pdb_file, chain_id):
+# waters are numbered on their own, apart from the residues of the chain
+WATERS = ('HOH', 'WAT', 'DOD')
+
+
+def read_chain_seqs(pdb_file, chain_ids):
     """
+    Streams the raw records of a PDB file to get the sequences of chains,
+    the same sequences pdb_reader.chain_residues gives with modified set:
+    amino acid residues with a CA atom, in the first model. Modified amino
+    acids stored as HETATM records, e.g. MSE, are part of the sequence with
+    the one-letter code of their parent, so that they are renumbered along
+    with the rest of the chain. Only the current residue of each chain is
+    held in memory.
 
     Parameters
     ----------
     pdb_file : str
+        Path to the PDB file, plain or gzip-compressed.
+    chain_ids : iterable
+        IDs of the chains.
 
+    Returns
+    -------
+    dict
+        One-letter sequence of each chain found in the file and the residue
+        ID of each residue in it, e.g. 42 or 100A, by chain ID.
+    """
+    residues = {c: [] for c in chain_ids}
+    # residue ID, residue name and whether a CA atom was seen, of the current
+    # residue of each chain
+    current = {}
+    with pdb_reader.open_text(pdb_file) as ipf:
+        for l in ipf:
+            if l.startswith('ENDMDL'):
+                break
+            if not l.startswith(('ATOM  ', 'HETATM')) or \
+                    l[21:22] not in residues:
+                continue
+            residue = current.get(l[21:22])
+            if residue is None or l[22:27] != residue[0]:
+                if residue is not None and residue[2] and \
+                        residue[1] in pdb_reader.EXTENDED_THREE_TO_ONE:
+                    residues[l[21:22]].append(
+                        (pdb_reader.EXTENDED_THREE_TO_ONE[residue[1]],
+                         residue[0].strip()))
+                residue = [l[22:27], l[17:20].strip().encode(), False]
+                current[l[21:22]] = residue
+            residue[2] |= l[12:16].strip() == 'CA'
+    for chain_id, residue in current.items():
+        if residue[2] and residue[1] in pdb_reader.EXTENDED_THREE_TO_ONE:
+            residues[chain_id].append(
+                (pdb_reader.EXTENDED_THREE_TO_ONE[residue[1]],
+                 residue[0].strip()))
+    return {c: (''.join(r[0] for r in residues[c]),
+                [r[1] for r in residues[c]]) for c in current}
+
+
+def read_chain_seq(pdb_file, chain_id):
+    """
+    Sequence of one chain of a PDB file, see read_chain_seqs.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to the PDB file, plain or gzip-compressed.
     chain_id : str
 
     Returns
     -------
     Bio.SeqRecord
+        The chain sequence, with the residue ID of each residue as the
+        residue_ids letter annotation, None if the chain is not in the file.
+    """
+    sequences = read_chain_seqs(pdb_file, [chain_id])
+    if chain_id not in sequences:
+        print('No chain ' + chain_id + ' was found in ' + pdb_file)
+        return None
+    sequence, residue_ids = sequences[chain_id]
+    chain_seq = Seq.Seq(sequence, ProteinAlphabet())
+    return SeqRecord.SeqRecord(chain_seq, id=chain_id, letter_annotations={
+        'residue_ids': residue_ids})
 
+
+def get_chain_seq(pdb_file, chain_id, fast=False):
     """
-    pdb_parser = PDBParser(PERMISSIVE=1)
-    structure = pdb_parser.get_structure(id='tmp', file=pdb_file)
+
+    Parameters
+    ----------
+    pdb_file : str
+
+    chain_id : str
+
+    fast : bool
+        Read the PDB file with the fast fixed-column reader, through the
+        parsed structure cache, instead of PDBParser.
+
+    Returns
+    -------
+    Bio.SeqRecord
+        The chain sequence, with the residue ID of each residue as the
+        residue_ids letter annotation.
+    """
+    if fast:
+        atoms = structure_cache.load_atoms(pdb_file)
+        if not (atoms.chain == chain_id.encode()).any():
+            print('No chain ' + chain_id + ' was found in ' + pdb_file)
+            return None
+        sequence, residue_ids = pdb_reader.chain_residues(atoms, chain_id,
+                                                          modified=True)
+        chain_seq = Seq.Seq(sequence, ProteinAlphabet())
+        return SeqRecord.SeqRecord(chain_seq, id=chain_id, letter_annotations={
+            'residue_ids': residue_ids})
+
+    structure = pdb_reader.parse_structure(pdb_file, 'tmp')
     try:
         chain = structure[0][chain_id]
     except KeyError:
         print('No chain ' + chain_id + ' was found in ' + pdb_file)
         return None
 
-    # build a polypeptide object from given chain
+    # build a polypeptide object from given chain, modified amino acids
+    # included as in read_chain_seqs
     ppb = PPBuilder()
     chain_seq = Seq.Seq('', ProteinAlphabet())
-    for pp in ppb.build_peptides(chain):
+    residue_ids = []
+    for pp in ppb.build_peptides(chain, aa_only=False):
         chain_seq += pp.get_sequence()
-    return SeqRecord.SeqRecord(chain_seq, id=chain_id)
+        residue_ids.extend(str(r.get_id()[1]) + r.get_id()[2].strip()
+                           for r in pp)
+    return SeqRecord.SeqRecord(chain_seq, id=chain_id, letter_annotations={
+        'residue_ids': residue_ids})
 
 
 def count_mismatches(seq_a, seq_b):
@@ -57,68 +172,396 @@ def count_mismatches(seq_a, seq_b):
     return count
 
 
-def pairwise_align(seq_a, seq_b):
+def pairwise_align(seq_a, seq_b, backend=sequence_aligner.DEFAULT_BACKEND):
     """
 
     Parameters
     ----------
     seq_a
     seq_b
+    backend : str
+        Alignment backend, see sequence_aligner.BACKENDS.
 
     Returns
     -------
 
     """
-    # now align the two given sequences
-    alignments = pairwise2.align.globalms(
-        seq_a, seq_b, 1, -0.5, -10, 0
-    )
+    # now align the two given sequences, or look up the alignment made by
+    # an earlier run
+    alignment = alignment_cache.align(seq_a, seq_b, backend)
     multiple_alignment = Align.MultipleSeqAlignment(
         [
-            SeqRecord.SeqRecord(seq=Seq.Seq(alignments[0][0]), id='PDB seq'),
-            SeqRecord.SeqRecord(seq=Seq.Seq(alignments[0][1]), id='Input seq')
+            SeqRecord.SeqRecord(seq=Seq.Seq(alignment[0]), id='PDB seq'),
+            SeqRecord.SeqRecord(seq=Seq.Seq(alignment[1]), id='Input seq')
         ]
     )
 
-    mismatches = count_mismatches(alignments[0][0], alignments[0][1])
-    if mismatches >= 0.1 * len(alignments[0][1]):
+    mismatches = count_mismatches(alignment[0], alignment[1])
+    if mismatches >= 0.1 * len(alignment[1]):
         print('Suspicious alignment between UniProt sequence and PDB sequence, '
               'please check')
 
     # print the alignment
-    print(pairwise2.format_alignment(*alignments[0]))
+    print(sequence_aligner.format_alignment(*alignment))
 
     # return the alignment
     return multiple_alignment
 
 
-def create_id_mapping(aligned_seq_a, aligned_seq_b, start_id=1):
+def read_mapping(mapping_file):
+    """
+    Reads a residue ID mapping, one old and one new residue ID per line.
+
+    Parameters
+    ----------
+    mapping_file : str
+
+    Returns
+    -------
+    dict
+        New residue ID keyed by old residue ID.
+    """
+    mapping = {}
+    with open(mapping_file, 'rt') as ipf:
+        for l in ipf:
+            old_id, new_id = l.strip().split()
+            try:
+                mapping[int(old_id)] = int(new_id)
+            except ValueError:
+                print(
+                    old_id, 'or', new_id, 'is not a valid '
+                    'residue sequence number, skipped.'
+                )
+                continue
+    return mapping
+
+
+def renumber_records(lines, mappings):
+    """
+    Renumbers the records of one or more chains, one line at a time.
+
+    Parameters
+    ----------
+    lines : iterable
+        PDB records.
+    mappings : dict
+        New residue IDs of each chain to be renumbered, by chain ID, as
+        returned by create_id_mapping: an array indexed by old residue ID
+        minus the first old residue ID, that first old residue ID and the
+        side table of residues with insertion codes.
+
+    Yields
+    ------
+    str
+        The records, those of residues in the chains with a new residue ID
+        renumbered, with a blank insertion code, and the others, waters
+        included, unchanged.
+
+    Raises
+    ------
+    ValueError
+        If a renumbered residue of a chain ends up with the residue ID of
+        another residue of the chain, e.g. of a residue without a
+        counterpart in the target sequence or a ligand, which keep their
+        old residue IDs. Waters are left out, they are numbered on their
+        own.
+    """
+    # format every new residue ID once, as the field that goes into columns
+    # 23-27 of the record, None for residues without one, and those of
+    # residues with insertion codes keyed by the old field
+    chains = {}
+    for chain_id, (ids, first_id, insertions) in mappings.items():
+        fields = np.char.mod('%4d ', ids).astype(object)
+        fields[ids <= INSERTION] = None
+        inserted = {'%4d%s' % old_id: '%4d ' % new_id
+                    for old_id, new_id in insertions.items()
+                    if new_id != UNMAPPED}
+        chains[chain_id] = fields.tolist(), first_id, inserted
+
+    # old residue ID of the current residue of each chain, and the residue
+    # IDs in the current model of the residues of each chain that keep
+    # their residue ID and of those that are given a new one
+    current = {}
+    kept = {chain_id: set() for chain_id in chains}
+    renumbered = {chain_id: set() for chain_id in chains}
+    for l in lines:
+        if l.startswith('MODEL'):
+            current.clear()
+            for residue_ids in kept.values():
+                residue_ids.clear()
+            for residue_ids in renumbered.values():
+                residue_ids.clear()
+        if (l.startswith(RENUMBERED_RECORDS) and l[21:22] in chains and
+                len(l) > 26):
+            chain_id = l[21:22]
+            new_l = l
+            if l[17:20] not in WATERS:
+                fields, first_id, inserted = chains[chain_id]
+                try:
+                    index = int(l[22:26]) - first_id
+                except ValueError:
+                    index = -1
+                if 0 <= index < len(fields):
+                    field = fields[index]
+                    if field is None:
+                        field = inserted.get(l[22:27])
+                    if field is not None:
+                        new_l = l[:22] + field + l[27:]
+                # a new residue starts where the old residue ID changes,
+                # only clashes with a renumbered residue are new
+                if (not l.startswith('TER') and
+                        current.get(chain_id) != l[22:27]):
+                    current[chain_id] = l[22:27]
+                    residue_id = new_l[22:27]
+                    if residue_id in renumbered[chain_id] or (
+                            residue_id != l[22:27] and
+                            residue_id in kept[chain_id]):
+                        raise ValueError(
+                            'Residue ID ' + residue_id.strip() + ' would be '
+                            'given to more than one residue of chain ' +
+                            chain_id + ', the residue ID of a renumbered '
+                            'residue clashes with that of another residue.')
+                    if residue_id != l[22:27]:
+                        renumbered[chain_id].add(residue_id)
+                    else:
+                        kept[chain_id].add(residue_id)
+            l = new_l
+        yield l
+
+
+def renumber_file(input_file, output_file, mappings):
+    """
+    Streams the records of a PDB file to another file, renumbering those of
+    the chains in mappings, see renumber_records. The records go to a
+    temporary file next to the output file, which replaces the output file
+    only once renumbering succeeds, so that a file can be renumbered in
+    place.
+
+    Returns
+    -------
+    str
+        The output file.
+    """
+    # the temporary file keeps the .gz extension so that it is compressed
+    # the same way as the output file
+    suffix = '.part.gz' if output_file.endswith('.gz') else '.part'
+    fd, tmp_file = tempfile.mkstemp(
+        suffix=suffix, dir=os.path.dirname(output_file) or '.')
+    os.close(fd)
+    try:
+        with pdb_reader.open_text(input_file) as ipf:
+            with pdb_reader.open_text(tmp_file, 'wt') as opf:
+                opf.writelines(renumber_records(ipf, mappings))
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return output_file
+
+
+def is_fasta(target_file):
     """
+    Whether a file is a fasta file, judged by its first character.
+    """
+    with open(target_file, 'rt') as ipf:
+        return ipf.read(1) == '>'
+
+
+def chain_mapping(chain_seq, target_file,
+                  backend=sequence_aligner.DEFAULT_BACKEND, start_seqres=None):
+    """
+    Residue ID mapping of one chain onto a target.
 
     Parameters
     ----------
-    aligned_seq_a
-    aligned_seq_b
-    start_id
+    chain_seq : tuple
+        Sequence of the chain and the residue ID of each residue, as read by
+        read_chain_seqs, None if the target is a mapping file.
+    target_file : str
+        A fasta file with the target sequence, to which the chain sequence is
+        aligned, or a residue ID mapping file.
+    backend : str
+        Alignment backend, see sequence_aligner.BACKENDS.
+    start_seqres : int
+        Residue ID of the first residue of the chain, the others are
+        numbered consecutively, instead of the residue IDs in the PDB file.
 
     Returns
     -------
+    tuple
+        The mapping as returned by create_id_mapping, and whether the
+        alignment looks suspicious.
+    """
+    if chain_seq is None:
+        return mapping_array(read_mapping(target_file)), False
+    sequence, residue_ids = chain_seq
+    target = SeqIO.read(target_file, format='fasta')
+    aligned_a, aligned_b, _ = alignment_cache.align(sequence,
+                                                    str(target.seq), backend)
+    suspicious = count_mismatches(aligned_a, aligned_b) >= 0.1 * len(aligned_b)
+    if start_seqres is not None:
+        residue_ids = None
+    else:
+        start_seqres = 1
+    mapping = create_id_mapping(aligned_a, aligned_b, start_seqres,
+                                residue_ids)
+    return mapping, suspicious
+
+
+def read_manifest(manifest, output_dir):
+    """
+    Reads a manifest of chains to renumber, one per line: a PDB file, a chain
+    ID, a target (a fasta file with the target sequence or a residue ID
+    mapping file) and, optionally, the output file, which defaults to a file
+    of the same name in output_dir. Lines starting with # are skipped.
+
+    Raises
+    ------
+    ValueError
+        If a PDB file is to be written over itself, or two PDB files to the
+        same output file.
 
+    Returns
+    -------
+    dict
+        Output file and target of each chain, by chain ID, keyed by PDB file
+        in the order of the manifest.
     """
-    id_mapping = {}
-    seq_a_id = start_id - 1
-    seq_b_id = 0
-    for x, y in zip(aligned_seq_a, aligned_seq_b):
-        if x != '-':
-            seq_a_id += 1
-        if y != '-':
-            seq_b_id += 1
-        if x != '-':
-            if y == '-':
-                id_mapping[seq_a_id] = None
+    entries = {}
+    # PDB file written to each output file, by absolute path
+    outputs = {}
+    with open(manifest, 'rt') as ipf:
+        for l in ipf:
+            fields = l.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) not in (3, 4):
+                raise ValueError('Expected a PDB file, a chain ID, a target '
+                                 'and optionally an output file: ' + l.strip())
+            pdb_file, chain_id, target = fields[:3]
+            if len(fields) == 4:
+                output_file = fields[3]
             else:
-                id_mapping[seq_a_id] = seq_b_id
-    return id_mapping
+                output_file = os.path.join(output_dir,
+                                           os.path.basename(pdb_file))
+            if os.path.abspath(output_file) == os.path.abspath(pdb_file):
+                raise ValueError(pdb_file + ' would be written over itself, '
+                                 'give another output file or directory.')
+            if pdb_file not in entries and os.path.abspath(output_file) in \
+                    outputs:
+                raise ValueError(pdb_file + ' and ' +
+                                 outputs[os.path.abspath(output_file)] +
+                                 ' would both be written to ' + output_file +
+                                 ', give their output files in the manifest.')
+            entry = entries.setdefault(pdb_file, (output_file, {}))
+            if entry[0] != output_file:
+                raise ValueError('Chains of ' + pdb_file + ' are to be '
+                                 'written to different output files.')
+            outputs[os.path.abspath(output_file)] = pdb_file
+            entry[1][chain_id] = target
+    return entries
+
+
+def run_batch(entries, jobs=None, backend=sequence_aligner.DEFAULT_BACKEND,
+              start_seqres=None):
+    """
+    Renumbers the chains of many PDB files in a pool of worker processes.
+    The sequences of the chains to be aligned are read in one pass per file,
+    every chain is aligned to its target in parallel and each file is then
+    rewritten once with the mappings of all its chains.
+
+    Parameters
+    ----------
+    entries : dict
+        Output file and target of each chain, see read_manifest.
+    jobs : int
+        Number of worker processes, defaults to the number of CPUs.
+    backend : str
+        Alignment backend, see sequence_aligner.BACKENDS.
+    start_seqres : int
+        Residue ID of the first residue of each chain, instead of the
+        residue IDs in the PDB files.
+
+    Returns
+    -------
+    tuple
+        The number of files renumbered, of suspicious alignments and of
+        failures.
+    """
+    num_files = num_suspicious = 0
+    failed = set()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # read the sequences of the chains to be aligned, chains given a
+        # mapping file need no alignment
+        sequence_futures = {}
+        mapping_futures = {pdb_file: {} for pdb_file in entries}
+        for pdb_file, (_, targets) in entries.items():
+            try:
+                aligned = {c: is_fasta(t) for c, t in targets.items()}
+            except OSError as e:
+                print('Failed to read a target of', pdb_file + ':', e,
+                      file=sys.stderr)
+                failed.add(pdb_file)
+                continue
+            chain_ids = [c for c in targets if aligned[c]]
+            if chain_ids:
+                future = executor.submit(read_chain_seqs, pdb_file, chain_ids)
+                sequence_futures[future] = pdb_file
+            for chain_id in targets:
+                if not aligned[chain_id]:
+                    mapping_futures[pdb_file][chain_id] = executor.submit(
+                        chain_mapping, None, targets[chain_id])
+
+        # align every chain as soon as the sequences of its file are read
+        for future in as_completed(sequence_futures):
+            pdb_file = sequence_futures[future]
+            try:
+                sequences = future.result()
+            except Exception as e:
+                print('Failed to read', pdb_file + ':', e, file=sys.stderr)
+                failed.add(pdb_file)
+                continue
+            for chain_id, target in entries[pdb_file][1].items():
+                if chain_id in mapping_futures[pdb_file]:
+                    continue
+                if chain_id not in sequences:
+                    print('No chain ' + chain_id + ' was found in ' + pdb_file,
+                          file=sys.stderr)
+                    failed.add(pdb_file)
+                    break
+                mapping_futures[pdb_file][chain_id] = executor.submit(
+                    chain_mapping, sequences[chain_id], target, backend,
+                    start_seqres)
+
+        # rewrite each file once with the mappings of all its chains
+        renumber_futures = {}
+        for pdb_file, (output_file, _) in entries.items():
+            if pdb_file in failed:
+                continue
+            mappings = {}
+            try:
+                for chain_id, future in mapping_futures[pdb_file].items():
+                    mappings[chain_id], suspicious = future.result()
+                    if suspicious:
+                        print('Suspicious alignment of chain', chain_id, 'of',
+                              pdb_file, 'with its target, please check')
+                        num_suspicious += 1
+            except Exception as e:
+                print('Failed to map', pdb_file + ':', e, file=sys.stderr)
+                failed.add(pdb_file)
+                continue
+            future = executor.submit(renumber_file, pdb_file, output_file,
+                                     mappings)
+            renumber_futures[future] = pdb_file
+        for future in as_completed(renumber_futures):
+            try:
+                print('Written', future.result())
+                num_files += 1
+            except Exception as e:
+                print('Failed to renumber', renumber_futures[future] + ':', e,
+                      file=sys.stderr)
+                failed.add(renumber_futures[future])
+    return num_files, num_suspicious, len(failed)
 
 
 def parse_cmd_args():
@@ -133,8 +576,8 @@ def parse_cmd_args():
     parser.add_argument('-m', '--mapping', dest='mapping', required=False,
                         type=str, help='Residue ID mapping from PDB IDs to '
                                        'target residue IDs.')
-    parser.add_argument('-i', '--input', dest='input', required=True, type=str,
-                        help='Input PDB file.')
+    parser.add_argument('-i', '--input', dest='input', required=False,
+                        type=str, help='Input PDB file.')
     parser.add_argument('-a', '--alignment', dest='alignment', required=False,
                         type=str, help='Pairwise alignment of the PDB sequence'
                                        'with the target sequence.')
@@ -142,13 +585,44 @@ def parse_cmd_args():
                         type=str, help='Pairwise alignment of the PDB sequence'
                                        'with the target sequence.')
     parser.add_argument('--start-seqres', dest='start_seqres', required=False,
-                        type=int, help='Pairwise alignment of the PDB sequence'
-                                       'with the target sequence.')
-    parser.add_argument('-c', '--chain-id', dest='pdb_chain', required=True,
+                        type=int, help='Residue ID of the first residue of '
+                        'the chain, the others are numbered consecutively. '
+                        'Defaults to the residue IDs in the PDB file, or to 1 '
+                        'with --alignment.')
+    parser.add_argument('-c', '--chain-id', dest='pdb_chain', required=False,
                         type=str, help='ID of the chain to be renumbered.')
     parser.add_argument('-o', '--output', dest='output', required=True,
-                        type=str, help='Output PDB file.')
-    return parser.parse_args()
+                        type=str, help='Output PDB file, or with --manifest '
+                        'the directory into which to write renumbered files '
+                        'the manifest gives no output file for.')
+    parser.add_argument('-l', '--manifest', dest='manifest', required=False,
+                        type=str, help='Chains to renumber, one per line: a '
+                        'PDB file, a chain ID, a fasta file with the target '
+                        'sequence or a residue ID mapping file, and '
+                        'optionally an output file. All the chains of a PDB '
+                        'file are renumbered in one pass.')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Number of worker processes with --manifest, '
+                        'defaults to the number of CPUs.')
+    parser.add_argument('--fast-reader', dest='fast_reader',
+                        action='store_true', help='Read the chain sequence '
+                        'with the fast fixed-column PDB reader and '
+                        'structure cache.')
+    parser.add_argument('--backend', dest='backend',
+                        default=sequence_aligner.DEFAULT_BACKEND,
+                        choices=list(sequence_aligner.BACKENDS),
+                        help='Alignment backend.')
+    parser.add_argument('--save-alignment', dest='save_alignment',
+                        required=False, type=str, help='File in which to '
+                        'store the alignment made for renumbering, defaults '
+                        'to the output file name with .alignment.fasta '
+                        'appended.')
+    args = parser.parse_args()
+    if args.manifest is None and (args.input is None or
+                                  args.pdb_chain is None):
+        parser.error('--input and --chain-id are required without '
+                     '--manifest')
+    return args
 
 
 def main():
@@ -161,61 +635,69 @@ def main():
     # parse command-line arguments
     args = parse_cmd_args()
 
+    # renumber every chain in the manifest, file by file
+    if args.manifest is not None:
+        try:
+            entries = read_manifest(args.manifest, args.output)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        os.makedirs(args.output, exist_ok=True)
+        num_files, num_suspicious, num_failed = run_batch(
+            entries, args.jobs, args.backend, args.start_seqres)
+        print(num_files, 'renumbered PDB files written,', num_suspicious,
+              'suspicious alignments,', num_failed, 'failures')
+        if num_failed:
+            raise SystemExit('%d of %d PDB files failed.' % (num_failed,
+                                                             len(entries)))
+        return
+
     # parse the input ID mapping into a dict
+    residue_ids = None
     if args.mapping is not None:
-        mapping = {}
-        with open(args.mapping, 'rt') as ipf:
-            for l in ipf:
-                old_id, new_id = l.strip().split()
-                try:
-                    mapping[int(old_id)] = int(new_id)
-                except ValueError:
-                    print(
-                        old_id, 'or', new_id, 'is not a valid '
-                        'residue sequence number, skipped.'
-                    )
-                    continue
+        mapping = mapping_array(read_mapping(args.mapping))
     else:  # no ID mapping given, create one by doing pairwise alignment
         if args.alignment is not None:
             print('Using alignment', args.alignment, 'for renumbering.')
             alignment = AlignIO.read(args.alignment, format='fasta')
         else:
-            seq_a = get_chain_seq(args.input, args.pdb_chain)
+            if args.fast_reader:
+                seq_a = get_chain_seq(args.input, args.pdb_chain, fast=True)
+            else:
+                seq_a = read_chain_seq(args.input, args.pdb_chain)
+            if args.start_seqres is None:
+                residue_ids = seq_a.letter_annotations['residue_ids']
             seq_b = SeqIO.read(args.sequence, format='fasta')
 
             # now align the two given sequences
             print('Now aligning the two given sequences using global alignment '
                   'and the identity matrix with -10 gap opening penalty...')
-            alignment = pairwise_align(seq_a.seq, seq_b.seq)
+            alignment = pairwise_align(seq_a.seq, seq_b.seq, args.backend)
 
-            # store the alignment to disk file
-            AlignIO.write(alignment, './alignment.fasta', 'fasta')
+            # store the alignment to disk file, next to the output so that
+            # concurrent runs do not overwrite each other's alignment
+            alignment_file = args.save_alignment
+            if alignment_file is None:
+                alignment_file = args.output + '.alignment.fasta'
+            AlignIO.write(alignment, alignment_file, 'fasta')
+            print('Alignment written to', alignment_file)
 
         if args.start_seqres is not None:
             start_seqres = args.start_seqres
         else:
             start_seqres = 1
         mapping = create_id_mapping(
-            alignment[0].seq, alignment[1].seq, start_seqres
+            alignment[0].seq, alignment[1].seq, start_seqres, residue_ids
         )
 
-    # renumber ATOM records of the requested chain
-    print('Renumbering records according to alignment:', './alignment.fasta')
-    new_records = []
-    with open(args.input, 'rt') as ipf:
-        for l in ipf:
-            if l.startswith('ATOM') and l[21] == args.pdb_chain:
-                # renumber the record
-                old_id = int(l[22:26])
-                new_id = mapping[old_id]
-                new_record = l[:22] + '%4s' % new_id + l[26:]
-                new_records.append(new_record)
-            else:
-                new_records.append(l)
-
-    # write renumbered record to output file
-    with open(args.output, 'wt') as opf:
-        opf.writelines(new_records)
+    # renumber the records of the requested chain
+    if args.mapping is not None:
+        print('Renumbering records according to mapping:', args.mapping)
+    else:
+        print('Renumbering records according to alignment.')
+    try:
+        renumber_file(args.input, args.output, {args.pdb_chain: mapping})
+    except ValueError as e:
+        raise SystemExit(str(e))
 
     # print final status
     print('Renumbered PDB records written to', args.output)
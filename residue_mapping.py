@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+Residue ID mappings shared by renumber_pdb.py and update_snv.py, kept apart
+from both scripts so that either imports only NumPy for them.
+
+A mapping is a dense int32 array of new residue IDs indexed by old residue ID
+minus the smallest old residue ID, together with that smallest old residue
+ID, so that a whole column of old residue IDs is translated with one array
+lookup. Residue sequence numbers shared by residues with insertion codes,
+e.g. 52, 52A and 52B in Kabat numbering, have the INSERTION entry in the
+array and their residues are looked up in a small side table instead.
+"""
+
+# imports from the standard library
+import string
+# imports from external libraries
+import numpy as np
+
+# new residue ID of residues that have no counterpart in the target sequence
+UNMAPPED = np.iinfo('int32').min
+# entry of residue sequence numbers shared by residues with insertion codes,
+# which one entry per residue sequence number cannot tell apart; the new
+# residue ID of each of these residues is in the side table
+INSERTION = UNMAPPED + 1
+
+
+def create_id_mapping(aligned_seq_a, aligned_seq_b, start_id=1,
+                      residue_ids=None):
+    """
+    Maps the residue IDs of sequence a onto the positions of the residues of
+    sequence b they are aligned with, counting from 1.
+
+    Parameters
+    ----------
+    aligned_seq_a, aligned_seq_b : str
+        The aligned sequences, with '-' for gaps.
+    start_id : int
+        Residue ID of the first residue of sequence a, the others are
+        numbered consecutively.
+    residue_ids : list
+        Residue IDs of the residues of sequence a, e.g. 42 or 100A, instead
+        of consecutive numbers from start_id.
+
+    Returns
+    -------
+    tuple
+        An int32 array of new residue IDs indexed by old residue ID minus
+        the smallest old residue ID, that smallest old residue ID and the
+        side table, as returned by mapping_array. Residues aligned with a
+        gap, and residue IDs not in sequence a, are UNMAPPED. Residue
+        sequence numbers with insertion codes are INSERTION, and the side
+        table gives the new residue ID of each residue sharing one, keyed by
+        residue sequence number and insertion code, ' ' for none.
+    """
+    a = np.frombuffer(str(aligned_seq_a).encode(), dtype='uint8')
+    b = np.frombuffer(str(aligned_seq_b).encode(), dtype='uint8')
+    if len(a) != len(b):
+        raise ValueError('The aligned sequences differ in length.')
+    in_a = a != ord('-')
+    in_b = b != ord('-')
+
+    # position in sequence b of each column of the alignment, then of each
+    # residue of sequence a
+    new_ids = np.cumsum(in_b, dtype='int32')
+    new_ids = np.where(in_b, new_ids, UNMAPPED)[in_a].astype('int32')
+    if residue_ids is None:
+        return new_ids, start_id, {}
+
+    if len(residue_ids) != len(new_ids):
+        raise ValueError('Expected %d residue IDs, got %d.' % (
+            len(new_ids), len(residue_ids)))
+    if not len(new_ids):
+        return new_ids, start_id, {}
+    labels = np.char.strip(np.asarray(residue_ids, dtype='U'))
+    numbers = np.char.rstrip(labels, string.ascii_letters)
+    inserted = np.char.str_len(numbers) < np.char.str_len(labels)
+    old_ids = numbers.astype('int64')
+    first_id = int(old_ids.min())
+    ids = np.full(int(old_ids.max()) - first_id + 1, UNMAPPED, dtype='int32')
+    ids[old_ids - first_id] = new_ids
+    shared = np.isin(old_ids, old_ids[inserted])
+    ids[old_ids[shared] - first_id] = INSERTION
+    insertions = {
+        (int(n), label[len(str(n)):] or ' '): int(new_id)
+        for n, label, new_id in zip(numbers[shared].tolist(),
+                                    labels[shared].tolist(),
+                                    new_ids[shared].tolist())
+    }
+    return ids, first_id, insertions
+
+
+def mapping_array(mapping):
+    """
+    Dense lookup array of a residue ID mapping.
+
+    Parameters
+    ----------
+    mapping : dict
+        New residue ID, or None, keyed by old residue ID.
+
+    Returns
+    -------
+    tuple
+        An int32 array of new residue IDs, UNMAPPED for residues without one,
+        indexed by old residue ID minus the smallest old residue ID, that
+        smallest old residue ID and an empty side table of residues with
+        insertion codes.
+    """
+    if not mapping:
+        return np.zeros(0, dtype='int32'), 0, {}
+    old_ids = np.fromiter(mapping, dtype='int64', count=len(mapping))
+    new_ids = np.array([UNMAPPED if v is None else v
+                        for v in mapping.values()], dtype='int32')
+    first_id = int(old_ids.min())
+    ids = np.full(int(old_ids.max()) - first_id + 1, UNMAPPED, dtype='int32')
+    ids[old_ids - first_id] = new_ids
+    return ids, first_id, {}
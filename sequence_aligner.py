@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+
+"""
+Global pairwise alignment of protein sequences behind one interface, used by
+pairwise_align.py and renumber_pdb.py.
+
+Every backend scores with the identity matrix: +1 for a match, -0.5 for a
+mismatch, -10 for opening a gap and 0 for extending it. The default backend,
+Bio.Align.PairwiseAligner, fills the dynamic programming matrix in C and
+traces back only the first optimal alignment. The pairwise2 backend is the
+previous implementation, which enumerates every co-optimal alignment, and is
+kept for comparison.
+
+Two more backends are meant for the nearly identical sequences of a PDB
+chain and its UniProt entry. The banded backend splits the sequences inside
+long stretches of identical residues they share and fills only the blocks of
+the dynamic programming matrix between split points, a band around the
+diagonal, falling back to the full matrix where an optimal path leaves the
+band. The hirschberg backend needs memory linear in the length of the
+sequences (Myers and Miller, 1988), for chains too long for a full traceback
+matrix.
+"""
+
+# imports from the standard library
+import bisect
+from argparse import ArgumentParser
+# imports from external libraries
+import numpy as np
+
+MATCH_SCORE = 1
+MISMATCH_SCORE = -0.5
+GAP_OPEN_SCORE = -10
+GAP_EXTEND_SCORE = 0
+
+
+class Aligner:
+    """
+    A global aligner of two sequences.
+    """
+    def align(self, seq_a, seq_b):
+        """
+        One optimal global alignment of two sequences.
+
+        Parameters
+        ----------
+        seq_a : str
+            The first sequence.
+        seq_b : str
+            The second sequence.
+
+        Returns
+        -------
+        tuple
+            The two aligned sequences, with '-' for gaps, and the score.
+        """
+        raise NotImplementedError
+
+    def score(self, seq_a, seq_b):
+        """
+        The score of an optimal global alignment of two sequences.
+        """
+        return self.align(seq_a, seq_b)[2]
+
+
+class PairwiseAlignerBackend(Aligner):
+    """
+    Aligns with Bio.Align.PairwiseAligner.
+    """
+    def __init__(self):
+        from Bio.Align import PairwiseAligner
+        self.aligner = PairwiseAligner()
+        self.aligner.mode = 'global'
+        self.aligner.match_score = MATCH_SCORE
+        self.aligner.mismatch_score = MISMATCH_SCORE
+        self.aligner.open_gap_score = GAP_OPEN_SCORE
+        self.aligner.extend_gap_score = GAP_EXTEND_SCORE
+
+    def align(self, seq_a, seq_b):
+        seq_a, seq_b = str(seq_a), str(seq_b)
+        # PairwiseAligner refuses empty sequences
+        if not seq_a or not seq_b:
+            return (seq_a + '-' * len(seq_b), '-' * len(seq_a) + seq_b,
+                    _gap(len(seq_a)) + _gap(len(seq_b)))
+        alignment = next(iter(self.aligner.align(seq_a, seq_b)))
+        return gapped_sequences(seq_a, seq_b, alignment.aligned) + (
+            alignment.score,)
+
+    def score(self, seq_a, seq_b):
+        seq_a, seq_b = str(seq_a), str(seq_b)
+        if not seq_a or not seq_b:
+            return _gap(len(seq_a)) + _gap(len(seq_b))
+        return self.aligner.score(seq_a, seq_b)
+
+
+class Pairwise2Backend(Aligner):
+    """
+    Aligns with Bio.pairwise2.align.globalms, keeping the first of all the
+    co-optimal alignments it enumerates.
+    """
+    def align(self, seq_a, seq_b):
+        from Bio import pairwise2
+        alignment = pairwise2.align.globalms(
+            str(seq_a), str(seq_b), MATCH_SCORE, MISMATCH_SCORE,
+            GAP_OPEN_SCORE, GAP_EXTEND_SCORE
+        )[0]
+        return alignment[0], alignment[1], alignment[2]
+
+    def score(self, seq_a, seq_b):
+        from Bio import pairwise2
+        return pairwise2.align.globalms(
+            str(seq_a), str(seq_b), MATCH_SCORE, MISMATCH_SCORE,
+            GAP_OPEN_SCORE, GAP_EXTEND_SCORE, score_only=True
+        )
+
+
+# affine gap scores written as G + E * length
+_G = GAP_OPEN_SCORE - GAP_EXTEND_SCORE
+_E = GAP_EXTEND_SCORE
+
+
+def _encode(seq):
+    return np.frombuffer(str(seq).encode(), dtype='uint8')
+
+
+def score_alignment(aligned_a, aligned_b):
+    """
+    The score of an alignment given as two aligned sequences.
+    """
+    score = 0
+    gap_a = gap_b = False
+    for a, b in zip(aligned_a, aligned_b):
+        if a == '-':
+            score += GAP_EXTEND_SCORE if gap_a else GAP_OPEN_SCORE
+            gap_a, gap_b = True, False
+        elif b == '-':
+            score += GAP_EXTEND_SCORE if gap_b else GAP_OPEN_SCORE
+            gap_a, gap_b = False, True
+        else:
+            score += MATCH_SCORE if a == b else MISMATCH_SCORE
+            gap_a = gap_b = False
+    return score
+
+
+def seed_chain(seq_a, seq_b, k=8):
+    """
+    Positions (i, j) in seq_a and seq_b of the longest chain of k-mers that
+    occur once in either sequence and in the same order in both. Chance
+    matches off the chain are left out.
+    """
+    def unique_kmers(seq):
+        kmers = {}
+        for i in range(len(seq) - k + 1):
+            kmer = seq[i:i + k]
+            kmers[kmer] = -1 if kmer in kmers else i
+        return kmers
+    kmers_a, kmers_b = unique_kmers(seq_a), unique_kmers(seq_b)
+    hits = sorted((i, kmers_b[kmer]) for kmer, i in kmers_a.items()
+                  if i >= 0 and kmers_b.get(kmer, -1) >= 0)
+
+    # longest chain increasing in both sequences, by patience sorting
+    tails, tail_hits, previous = [], [], []
+    for h, (i, j) in enumerate(hits):
+        n = bisect.bisect_left(tails, j)
+        if n == len(tails):
+            tails.append(j)
+            tail_hits.append(h)
+        else:
+            tails[n], tail_hits[n] = j, h
+        previous.append(tail_hits[n - 1] if n > 0 else -1)
+    chain = []
+    h = tail_hits[-1] if tail_hits else -1
+    while h >= 0:
+        chain.append(hits[h])
+        h = previous[h]
+    return chain[::-1]
+
+
+class BandedBackend(Aligner):
+    """
+    Aligns only along the chain of k-mers shared by the two sequences, see
+    seed_chain.
+
+    The sequences are split in the middle of stretches of at least 2k - 1
+    identical residues on the chain, at least step residues apart. The
+    pieces between split points, e.g. a stretch with substitutions, a
+    replaced loop, an expression tag or the rest of a UniProt sequence, are
+    aligned with full dynamic programming, so only the blocks of the matrix
+    around the chain are filled, a band about step wide for nearly
+    identical sequences.
+
+    An optimal alignment need not go through the split points, e.g. around
+    repeats. The band is taken to overflow, and everything is aligned with
+    full dynamic programming, where two neighbouring pieces aligned as one
+    block score better than apart, i.e. the best path through the block
+    avoids the split point between them; see overflows. This catches a path
+    leaving the band near one split point, not one skipping several, so the
+    result is only nearly always optimal. Everything is also aligned with
+    full dynamic programming if the sequences share too few k-mers.
+    """
+    def __init__(self, k=8, step=64, min_seeds=0.05, max_full_cells=2**27):
+        """
+
+        Parameters
+        ----------
+        k : int
+            Length of the k-mers seeding the chain.
+        step : int
+            Residues of the first sequence between split points, fewer and
+            larger pieces take more time in dynamic programming, more and
+            smaller ones in calls to the aligner.
+        min_seeds : float
+            Shared k-mers needed per residue of the shorter sequence.
+        max_full_cells : int
+            Fall back to the linear-memory Hirschberg backend instead of
+            PairwiseAligner for larger matrices.
+        """
+        self.k = k
+        self.step = step
+        self.min_seeds = min_seeds
+        self.max_full_cells = max_full_cells
+
+    def full(self, seq_a, seq_b):
+        if (len(seq_a) + 1) * (len(seq_b) + 1) > self.max_full_cells:
+            return get_aligner('hirschberg').align(seq_a, seq_b)
+        return get_aligner('pairwise_aligner').align(seq_a, seq_b)
+
+    def split_points(self, seq_a, seq_b):
+        """
+        Positions (i, j) in seq_a and seq_b at which the sequences are split,
+        from (0, 0) to the ends of both, None if they share too few k-mers.
+        """
+        chain = seed_chain(seq_a, seq_b, self.k)
+        if not chain or len(chain) < self.min_seeds * min(len(seq_a),
+                                                          len(seq_b)):
+            return None
+
+        # split inside long identical stretches, i.e. k consecutive k-mers
+        # of the chain on one diagonal, keeping the last one
+        anchors = [
+            (i + self.k - 1, j + self.k - 1)
+            for n, (i, j) in enumerate(chain[:max(len(chain) - self.k + 1, 0)])
+            if chain[n + self.k - 1] == (i + self.k - 1, j + self.k - 1)
+        ]
+        splits = [(0, 0)]
+        for n, (i, j) in enumerate(anchors):
+            if i - splits[-1][0] >= self.step or (
+                    n == len(anchors) - 1 and i > splits[-1][0]):
+                splits.append((i, j))
+        splits.append((len(seq_a), len(seq_b)))
+        return splits
+
+    def overflows(self, seq_a, seq_b, splits, parts):
+        """
+        Whether an optimal alignment of two neighbouring pieces, parts being
+        the alignments of the pieces between splits, avoids the split point
+        between them. Each block is scored in memory linear in its length.
+        """
+        aligner = get_aligner('pairwise_aligner')
+        for n in range(1, len(splits) - 1):
+            (i1, j1), (i2, j2) = splits[n - 1], splits[n + 1]
+            joined = score_alignment(parts[n - 1][0] + parts[n][0],
+                                     parts[n - 1][1] + parts[n][1])
+            if aligner.score(seq_a[i1:i2], seq_b[j1:j2]) > joined + 1e-6:
+                return True
+        return False
+
+    def align(self, seq_a, seq_b):
+        seq_a, seq_b = str(seq_a), str(seq_b)
+        splits = self.split_points(seq_a, seq_b)
+        if splits is None:
+            return self.full(seq_a, seq_b)
+        parts = [self.full(seq_a[i1:i2], seq_b[j1:j2])
+                 for (i1, j1), (i2, j2) in zip(splits, splits[1:])]
+        if self.overflows(seq_a, seq_b, splits, parts):
+            return self.full(seq_a, seq_b)
+
+        # pieces are joined as they are, gaps meeting at a split point are
+        # scored as one by score_alignment
+        aligned_a = ''.join(part[0] for part in parts)
+        aligned_b = ''.join(part[1] for part in parts)
+        return aligned_a, aligned_b, score_alignment(aligned_a, aligned_b)
+
+
+def _last_row(a, b, tb):
+    """
+    Scores of globally aligning all of a with each prefix b[:j], the best
+    of all and those ending with a gap along b, keeping a single row of the
+    matrix. A gap along b from the top left corner is opened with score tb.
+    """
+    cols = np.arange(len(b) + 1)
+    CC = _G + _E * cols.astype(float)
+    CC[0] = 0
+    DD = np.full(len(cols), -np.inf)
+    for i in range(1, len(a) + 1):
+        DD = np.maximum(DD + _E, CC + _G + _E)
+        DD[0] = tb + _E * i
+        M = np.full(len(cols), -np.inf)
+        M[1:] = CC[:-1] + np.where(b == a[i - 1], MATCH_SCORE, MISMATCH_SCORE)
+        X = np.maximum(M, DD)
+        C = np.maximum.accumulate(X - _E * cols)
+        CC = X.copy()
+        CC[1:] = np.maximum(X[1:], _G + _E * cols[1:] + C[:-1])
+    return CC, DD
+
+
+def _gap(length):
+    return _G + _E * length if length else 0
+
+
+def hirschberg_align(a, b, tb=_G, te=_G):
+    """
+    Global alignment in linear space, after Myers and Miller (1988). The
+    rows of a are split in half, the column where an optimal path crosses
+    the middle is found from one forward and one backward pass, and both
+    halves are aligned recursively.
+
+    Parameters
+    ----------
+    a, b : numpy.ndarray
+        The sequences as byte arrays.
+    tb, te : float
+        Scores for opening a gap along b at the top left and bottom right
+        corner, 0 where it continues a gap of the enclosing problem.
+
+    Returns
+    -------
+    list
+        The aligned columns as (index into a or -1, index into b or -1).
+    """
+    m, n = len(a), len(b)
+    if n == 0:
+        return [(i, -1) for i in range(m)]
+    if m == 0:
+        return [(-1, j) for j in range(n)]
+    if m == 1:
+        # either a gap for the single residue of a, or a match with b[j]
+        best = max(tb, te) + _E + _gap(n)
+        best_j = -1
+        for j in range(n):
+            score = _gap(j) + (MATCH_SCORE if a[0] == b[j] else
+                               MISMATCH_SCORE) + _gap(n - j - 1)
+            if score > best:
+                best, best_j = score, j
+        if best_j < 0:
+            gap = [(0, -1)]
+            b_gap = [(-1, j) for j in range(n)]
+            return gap + b_gap if tb >= te else b_gap + gap
+        return ([(-1, j) for j in range(best_j)] + [(0, best_j)] +
+                [(-1, j) for j in range(best_j + 1, n)])
+
+    mid = m // 2
+    CC, DD = _last_row(a[:mid], b, tb)
+    RR, SS = _last_row(a[mid:][::-1], b[::-1], te)
+    RR, SS = RR[::-1], SS[::-1]
+    through = CC + RR
+    # a gap along b crossing the middle is opened only once
+    across = DD + SS - _G
+    j1, j2 = int(np.argmax(through)), int(np.argmax(across))
+    if through[j1] >= across[j2]:
+        top = hirschberg_align(a[:mid], b[:j1], tb, _G)
+        bottom = hirschberg_align(a[mid:], b[j1:], _G, te)
+        return top + [(i + mid if i >= 0 else -1, j + j1 if j >= 0 else -1)
+                      for i, j in bottom]
+    top = hirschberg_align(a[:mid - 1], b[:j2], tb, 0)
+    bottom = hirschberg_align(a[mid + 1:], b[j2:], 0, te)
+    return top + [(mid - 1, -1), (mid, -1)] + [
+        (i + mid + 1 if i >= 0 else -1, j + j2 if j >= 0 else -1)
+        for i, j in bottom]
+
+
+class HirschbergBackend(Aligner):
+    """
+    Aligns in memory linear in the length of the sequences, see
+    hirschberg_align. The rows are filled with array operations in Python,
+    10 to 30 times slower than PairwiseAligner fills a full matrix in C for
+    a few hundred to a few thousand residues, so this only pays off where a
+    full traceback matrix does not fit in memory.
+    """
+    def align(self, seq_a, seq_b):
+        seq_a, seq_b = str(seq_a), str(seq_b)
+        columns = hirschberg_align(_encode(seq_a), _encode(seq_b))
+        aligned_a = ''.join(seq_a[i] if i >= 0 else '-' for i, _ in columns)
+        aligned_b = ''.join(seq_b[j] if j >= 0 else '-' for _, j in columns)
+        return aligned_a, aligned_b, score_alignment(aligned_a, aligned_b)
+
+
+# aligner classes by name, the first is the default
+BACKENDS = {
+    'pairwise_aligner': PairwiseAlignerBackend,
+    'pairwise2': Pairwise2Backend,
+    'banded': BandedBackend,
+    'hirschberg': HirschbergBackend,
+}
+DEFAULT_BACKEND = 'pairwise_aligner'
+
+_aligners = {}
+
+
+def get_aligner(backend=DEFAULT_BACKEND):
+    """
+    The aligner of the given backend, created once per process.
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown alignment backend %r, choose from %s.' % (
+            backend, ', '.join(BACKENDS)))
+    if backend not in _aligners:
+        _aligners[backend] = BACKENDS[backend]()
+    return _aligners[backend]
+
+
+def global_align(seq_a, seq_b, backend=DEFAULT_BACKEND):
+    """
+    One optimal global alignment of two sequences as the two aligned
+    sequences and the score, see Aligner.align.
+    """
+    return get_aligner(backend).align(seq_a, seq_b)
+
+
+def gapped_sequences(seq_a, seq_b, aligned):
+    """
+    The two aligned sequences, with '-' for gaps, from the aligned blocks of
+    an alignment, i.e. pairs of (start, end) ranges of the two sequences.
+    """
+    parts_a, parts_b = [], []
+    i = j = 0
+    for (start_a, end_a), (start_b, end_b) in zip(*aligned):
+        # residues of either sequence between two blocks face gaps
+        parts_a.append(seq_a[i:start_a] + '-' * (start_b - j))
+        parts_b.append('-' * (start_a - i) + seq_b[j:start_b])
+        parts_a.append(seq_a[start_a:end_a])
+        parts_b.append(seq_b[start_b:end_b])
+        i, j = end_a, end_b
+    parts_a.append(seq_a[i:] + '-' * (len(seq_b) - j))
+    parts_b.append('-' * (len(seq_a) - i) + seq_b[j:])
+    return ''.join(parts_a), ''.join(parts_b)
+
+
+def format_alignment(aligned_a, aligned_b, score):
+    """
+    An alignment as text in the layout of pairwise2.format_alignment.
+    """
+    matches = ''.join(
+        ' ' if a == '-' or b == '-' else '|' if a == b else '.'
+        for a, b in zip(aligned_a, aligned_b)
+    )
+    return '%s\n%s\n%s\n  Score=%g\n' % (aligned_a, matches, aligned_b, score)
+
+
+def main():
+    parser = ArgumentParser(description='Globally align two sequences.')
+    parser.add_argument('seq_a', help='the first sequence')
+    parser.add_argument('seq_b', help='the second sequence')
+    parser.add_argument('--backend', dest='backend', default=DEFAULT_BACKEND,
+                        choices=list(BACKENDS), help='alignment backend')
+    args = parser.parse_args()
+    print(format_alignment(*global_align(args.seq_a, args.seq_b,
+                                         args.backend)))
+
+
+if __name__ == '__main__':
+    main()
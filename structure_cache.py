@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+"""
+An on-disk cache of PDB files parsed by pdb_reader.py.
+
+Parsed atom arrays are stored as uncompressed .npz files in a cache
+directory, keyed by the path, modification time and size of the PDB file (or
+by a hash of its content), so repeated runs over the same files skip parsing.
+The cache is bounded in size; the least recently used entries are evicted
+first, see disk_cache.py.
+
+The cache directory defaults to ~/.cache/script_repo/structures and can be
+changed with the PDB_CACHE_DIR environment variable; setting it to an empty
+string turns caching off. PDB_CACHE_MAX_MB bounds the size of the cache
+(default 2048) and PDB_CACHE_KEY=content keys entries by content hash.
+"""
+
+# imports from the standard library
+import hashlib
+import os
+import tempfile
+from argparse import ArgumentParser
+# imports from external libraries
+import numpy as np
+# imports from this repository
+import pdb_reader
+from disk_cache import added, evict
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'script_repo', 'structures')
+
+
+def get_cache_dir():
+    """
+    The cache directory, None if caching is turned off.
+    """
+    cache_dir = os.environ.get('PDB_CACHE_DIR', DEFAULT_CACHE_DIR)
+    return cache_dir or None
+
+
+def get_max_bytes():
+    """
+    Size bound of the cache in bytes.
+    """
+    return int(float(os.environ.get('PDB_CACHE_MAX_MB', 2048)) * 2**20)
+
+
+def cache_key(pdb_file, content=None):
+    """
+    Key of the cache entry for a PDB file. It includes pdb_reader.VERSION,
+    so entries written by an older reader are not used.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to the PDB file.
+    content : bool
+        Hash the content of the file instead of its path, modification time
+        and size. Defaults to the PDB_CACHE_KEY environment variable.
+
+    Returns
+    -------
+    str
+        A hex digest.
+    """
+    if content is None:
+        content = os.environ.get('PDB_CACHE_KEY') == 'content'
+    digest = hashlib.sha1(b'%d:' % pdb_reader.VERSION)
+    if content:
+        with open(pdb_file, 'rb') as ipf:
+            for block in iter(lambda: ipf.read(2**20), b''):
+                digest.update(block)
+    else:
+        stat = os.stat(pdb_file)
+        digest.update(('%s:%d:%d' % (os.path.abspath(pdb_file),
+                                     stat.st_mtime_ns, stat.st_size)).encode())
+    return digest.hexdigest()
+
+
+def load_atoms(pdb_file, cache_dir=None, max_bytes=None):
+    """
+    Atom arrays of a PDB file, from the cache if they are there, otherwise
+    read with pdb_reader.read_atoms and added to the cache.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to the PDB file.
+    cache_dir : str
+        Cache directory, defaults to get_cache_dir().
+    max_bytes : int
+        Size bound of the cache, defaults to get_max_bytes().
+
+    Returns
+    -------
+    pdb_reader.Atoms
+        The atom records as arrays.
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return pdb_reader.read_atoms(pdb_file)
+
+    entry = os.path.join(cache_dir, cache_key(pdb_file) + '.npz')
+    try:
+        with np.load(entry) as data:
+            atoms = pdb_reader.Atoms(**{f: data[f] for f in data.files})
+        # mark the entry as recently used
+        os.utime(entry)
+        return atoms
+    except (OSError, ValueError, KeyError):
+        pass
+
+    atoms = pdb_reader.read_atoms(pdb_file)
+    # an unusable cache directory leaves the result uncached
+    size = store(atoms, entry)
+    if size:
+        added(cache_dir, get_max_bytes() if max_bytes is None else max_bytes,
+              '.npz', size)
+    return atoms
+
+
+def store(atoms, entry):
+    """
+    Writes atom arrays to a cache entry. The arrays are written to a
+    temporary file first and renamed, so concurrent readers never see a
+    partial entry. Returns the size of the entry, 0 if it was not written.
+    """
+    cache_dir = os.path.dirname(entry)
+    tmp_file = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(suffix='.npz.tmp', dir=cache_dir)
+        with os.fdopen(fd, 'wb') as opf:
+            np.savez(opf, **{f: getattr(atoms, f) for f in atoms.fields})
+        os.replace(tmp_file, entry)
+        return os.path.getsize(entry)
+    except OSError:
+        return 0
+    finally:
+        if tmp_file is not None and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def main():
+    parser = ArgumentParser(description='Fill or clear the cache of parsed '
+                            'PDB files.')
+    parser.add_argument('-p', '--pdb', dest='pdbs', nargs='*', default=[],
+                        help='PDB files to add to the cache')
+    parser.add_argument('--clear', dest='clear', action='store_true',
+                        help='remove every entry from the cache')
+    args = parser.parse_args()
+
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        raise SystemExit('Caching is turned off, PDB_CACHE_DIR is empty.')
+    if args.clear and os.path.isdir(cache_dir):
+        evict(cache_dir, 0, '.npz')
+    for pdb_file in args.pdbs:
+        print(pdb_file, len(load_atoms(pdb_file, cache_dir)), 'atoms')
+
+
+if __name__ == '__main__':
+    main()
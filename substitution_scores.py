@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""
+Scores amino acid substitutions with one or more substitution matrices at
+once: Grantham distances, BLOSUM62, PAM250 and Miyata distances.
+
+The requested matrices are stacked into one (n_matrices, 20, 20) array, so a
+single pass over a list of amino acid pairs yields every score column. Each
+matrix is loaded once per process and then shared by every caller.
+
+    >>> import substitution_scores
+    >>> substitution_scores.score_pairs('ACW', 'SCF', ['grantham', 'miyata'])
+    array([[99.  ,  0.  , 40.  ],
+           [ 0.51,  0.  ,  1.11]], dtype=float32)
+
+On the command line, pairs are read in the same format as
+get_grantham_scores.py and written as CSV rows with one score column per
+matrix.
+"""
+
+# imports from the standard library
+from argparse import ArgumentParser
+from functools import lru_cache
+# imports from external libraries
+import numpy as np
+# imports from this repository
+import get_grantham_scores
+from get_grantham_scores import AMINO_ACIDS, AA_INDEX
+
+# Miyata et al. (1979) distances, lower triangle in the order of AMINO_ACIDS
+MIYATA_DISTANCES = [
+    [0.00],
+    [1.39, 0.00],
+    [2.37, 3.48, 0.00],
+    [2.46, 3.26, 0.90, 0.00],
+    [3.23, 2.24, 4.27, 3.59, 0.00],
+    [0.91, 2.22, 2.37, 2.78, 4.14, 0.00],
+    [2.17, 2.56, 1.72, 0.96, 2.63, 2.78, 0.00],
+    [2.69, 1.63, 3.98, 3.39, 0.61, 3.60, 2.45, 0.00],
+    [2.96, 3.27, 2.05, 1.14, 2.85, 3.54, 0.79, 2.84, 0.00],
+    [2.76, 1.65, 4.10, 3.53, 0.63, 3.67, 2.59, 0.14, 2.98, 0.00],
+    [2.42, 1.46, 3.69, 3.13, 0.82, 3.34, 2.19, 0.29, 2.63, 0.41, 0.00],
+    [1.78, 2.83, 0.65, 0.85, 3.70, 1.96, 1.29, 3.37, 1.84, 3.49, 3.08, 0.00],
+    [0.06, 1.33, 2.40, 2.48, 3.17, 0.97, 2.15, 2.62, 2.94, 2.70, 2.36, 1.80,
+     0.00],
+    [1.92, 2.48, 1.47, 0.84, 2.81, 2.48, 0.32, 2.57, 1.06, 2.70, 2.30, 0.99,
+     1.92, 0.00],
+    [2.92, 3.06, 2.34, 1.45, 2.47, 3.58, 0.82, 2.49, 0.40, 2.62, 2.29, 2.04,
+     2.90, 1.13, 0.00],
+    [0.51, 1.84, 1.87, 2.06, 3.45, 0.85, 1.94, 2.95, 2.71, 3.04, 2.67, 1.31,
+     0.56, 1.65, 2.74, 0.00],
+    [0.90, 1.45, 2.05, 1.83, 2.60, 1.70, 1.32, 2.14, 2.10, 2.25, 1.86, 1.40,
+     0.87, 1.12, 2.03, 0.89, 0.00],
+    [1.85, 0.86, 3.40, 2.97, 1.43, 2.76, 2.11, 0.85, 2.70, 0.91, 0.62, 2.76,
+     1.79, 2.13, 2.43, 2.15, 1.42, 0.00],
+    [4.23, 3.34, 4.88, 4.08, 1.11, 5.13, 3.16, 1.72, 3.11, 1.73, 1.89, 4.39,
+     4.17, 3.42, 2.72, 4.38, 3.50, 2.51, 0.00],
+    [3.18, 2.38, 3.95, 3.22, 0.48, 4.08, 2.27, 0.86, 2.42, 0.94, 0.93, 3.42,
+     3.12, 2.48, 2.02, 3.33, 2.45, 1.52, 1.06, 0.00],
+]
+
+
+def _grantham():
+    return get_grantham_scores.GRANTHAM_MATRIX
+
+
+def _miyata():
+    matrix = np.zeros((20, 20))
+    for i, row in enumerate(MIYATA_DISTANCES):
+        matrix[i, :len(row)] = row
+    return matrix + np.tril(matrix, -1).T
+
+
+def _biopython(name):
+    # imported here so that the other matrices do not need Bio.Align
+    from Bio.Align import substitution_matrices
+    matrix = substitution_matrices.load(name)
+    return np.array([[matrix[a][b] for b in AMINO_ACIDS] for a in AMINO_ACIDS])
+
+
+# loader and output format of each matrix, by name
+MATRICES = {
+    'grantham': (_grantham, '%d'),
+    'blosum62': (lambda: _biopython('BLOSUM62'), '%d'),
+    'pam250': (lambda: _biopython('PAM250'), '%d'),
+    'miyata': (_miyata, '%.2f'),
+}
+
+
+@lru_cache(maxsize=None)
+def load_matrix(name):
+    """
+    A substitution matrix as a (20, 20) float32 array indexed in the order
+    of AMINO_ACIDS. Each matrix is loaded once per process.
+    """
+    try:
+        loader = MATRICES[name.lower()][0]
+    except KeyError:
+        raise ValueError('Unknown substitution matrix %r, choose from %s.' % (
+            name, ', '.join(MATRICES)))
+    matrix = np.asarray(loader(), dtype='float32')
+    matrix.setflags(write=False)
+    return matrix
+
+
+@lru_cache(maxsize=None)
+def _load_stack(names):
+    stack = np.stack([load_matrix(name) for name in names])
+    stack.setflags(write=False)
+    return stack
+
+
+def load_matrices(names):
+    """
+    The given substitution matrices stacked into an (n_matrices, 20, 20)
+    float32 array, shared by every caller asking for the same matrices.
+    """
+    return _load_stack(tuple(name.lower() for name in names))
+
+
+def encode(residues):
+    """
+    Indices into AMINO_ACIDS of a string or bytes of one-letter codes, or of
+    an array of byte values.
+
+    Raises ValueError for codes that are not one of the 20 amino acids.
+    """
+    if isinstance(residues, str):
+        residues = residues.encode()
+    if isinstance(residues, bytes):
+        residues = np.frombuffer(residues, dtype='uint8')
+    indices = AA_INDEX[np.asarray(residues, dtype='uint8')]
+    if (indices < 0).any():
+        raise ValueError('Not an amino acid: %r' % bytes(
+            np.asarray(residues, dtype='uint8')[indices < 0][:1]).decode())
+    return indices
+
+
+def score_pairs(residues_a, residues_b, names=('grantham',)):
+    """
+    Scores substitutions of residues_a by residues_b with every given
+    matrix.
+
+    Parameters
+    ----------
+    residues_a, residues_b : str, bytes or numpy.ndarray
+        One-letter codes of the same length, or indices into AMINO_ACIDS as
+        returned by encode or get_grantham_scores.parse_pairs.
+    names : sequence of str
+        Names of matrices in MATRICES.
+
+    Returns
+    -------
+    numpy.ndarray
+        A (n_matrices, n_pairs) float32 array of scores.
+    """
+    index_a, index_b = residues_a, residues_b
+    if not (isinstance(index_a, np.ndarray) and index_a.dtype == 'int8'):
+        index_a = encode(residues_a)
+    if not (isinstance(index_b, np.ndarray) and index_b.dtype == 'int8'):
+        index_b = encode(residues_b)
+    return load_matrices(names)[:, index_a, index_b]
+
+
+@lru_cache(maxsize=None)
+def _row_table(names):
+    stack = load_matrices(names)
+    formats = ','.join(MATRICES[name][1] for name in names)
+    rows = [
+        ('%s,%s,' % (a, b) + formats % tuple(stack[:, i, j]) + '\r\n').encode()
+        for i, a in enumerate(AMINO_ACIDS) for j, b in enumerate(AMINO_ACIDS)
+    ]
+    row_lengths = np.array([len(r) for r in rows])
+    row_bytes = np.array([list(r.ljust(row_lengths.max())) for r in rows],
+                         dtype='uint8')
+    return row_bytes, row_lengths
+
+
+def row_table(names):
+    """
+    Output rows, e.g. 'A,C,195,0\\r\\n', for every pair of residue indices
+    (20 * a + b) as padded bytes and their lengths, see
+    get_grantham_scores.format_scores.
+    """
+    return _row_table(tuple(name.lower() for name in names))
+
+
+def score_file(in_f, out_f, names=('grantham',),
+               chunk_size=get_grantham_scores.CHUNK_SIZE):
+    """
+    Scores every amino acid pair in a binary file object with every given
+    matrix and writes one CSV row per pair to another.
+    """
+    row_bytes, row_lengths = row_table(names)
+    get_grantham_scores.score_file(in_f, out_f, chunk_size, row_bytes,
+                                   row_lengths)
+
+
+def main():
+    parser = ArgumentParser(description='Score amino acid substitutions with '
+                            'one or more substitution matrices.')
+    parser.add_argument('-i', '--input', dest='input', default='-',
+                        help='a file with one amino acid pair per line, '
+                        'separated by a space, comma, colon or semicolon, '
+                        'may be gzip-compressed, defaults to standard input')
+    parser.add_argument('-o', '--output', dest='output', default='-',
+                        help='output CSV file, gzip-compressed if its name '
+                        'ends with .gz, defaults to standard output')
+    parser.add_argument('-m', '--matrices', dest='matrices', nargs='+',
+                        default=['grantham'], choices=list(MATRICES),
+                        help='matrices to score with, one output column '
+                        'each, default grantham')
+    parser.add_argument('--header', dest='header', action='store_true',
+                        help='write a header row')
+    parser.add_argument('-z', '--gzip', dest='gzip', action='store_true',
+                        help='compress the output with gzip')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=float,
+                        default=16, help='megabytes of input to score at a '
+                        'time, default 16')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='number of worker processes')
+    args = parser.parse_args()
+
+    chunk_size = max(int(args.chunk_size * 2**20), 1)
+    header = b''
+    if args.header:
+        header = (','.join(['aa1', 'aa2'] + args.matrices) + '\r\n').encode()
+    if args.jobs > 1:
+        row_bytes, row_lengths = row_table(args.matrices)
+        get_grantham_scores.score_parallel(args.input, args.output, args.jobs,
+                                           args.gzip, chunk_size, row_bytes,
+                                           row_lengths, header)
+        return
+    with get_grantham_scores.open_input(args.input) as in_f:
+        with get_grantham_scores.open_output(args.output, args.gzip) as out_f:
+            out_f.write(header)
+            score_file(in_f, out_f, args.matrices, chunk_size)
+
+
+if __name__ == '__main__':
+    main()
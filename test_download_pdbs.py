@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ENTRY = (
+    'ATOM      1  CA  ALA A   1      11.104   6.134  -6.504  1.00  0.00'
+    '           C\nEND\n'
+)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Serves ENTRY for every .pdb file, except for 1err.pdb, which fails once
+    with a 500, 4mov.pdb, which redirects to a mirror path, and 3nof.pdb,
+    which is not found.
+    """
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        name = os.path.basename(self.path)
+        if name == '3nof.pdb':
+            self.reply(404, b'not found')
+        elif name == '1err.pdb' and self.requests.count(self.path) == 1:
+            self.reply(500, b'try again')
+        elif self.path == '/pdb/4mov.pdb':
+            self.reply(302, b'', {'Location': '/mirror/4mov.pdb'})
+        else:
+            self.reply(200, ENTRY.encode())
+
+    def reply(self, status, body, headers={}):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    FixtureHandler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/pdb/' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def download(tmp_path, base_url, pdb_ids, *options):
+    id_list = tmp_path / 'ids.txt'
+    id_list.write_text('\n'.join(pdb_ids) + '\n')
+    return subprocess.run(
+        [sys.executable, os.path.join(HERE, 'download_pdbs.py'),
+         '-l', str(id_list), '-d', str(tmp_path / 'pdbs') + '/',
+         '--base-url', base_url, '--report', str(tmp_path / 'report.tsv')]
+        + list(options), capture_output=True, text=True)
+
+
+def test_download(tmp_path, server):
+    result = download(tmp_path, server, ['1err', '2abc', '3nof', '4mov'])
+
+    # the 404 fails the run, the others are downloaded
+    assert result.returncode != 0
+    assert '1 of 4 entries failed to download' in result.stderr
+    for pdb_file in ['er/1err.pdb', 'ab/2abc.pdb', 'mo/4mov.pdb']:
+        assert (tmp_path / 'pdbs' / pdb_file).read_text() == ENTRY
+    assert not (tmp_path / 'pdbs' / 'no' / '3nof.pdb').exists()
+    assert (tmp_path / 'report.tsv').read_text().startswith(
+        '3nof\tdownload\tHTTP 404')
+
+    # 1err is retried after its 500, 3nof is not retried after its 404
+    assert FixtureHandler.requests.count('/pdb/1err.pdb') == 2
+    assert FixtureHandler.requests.count('/pdb/3nof.pdb') == 1
+    assert '/mirror/4mov.pdb' in FixtureHandler.requests
+
+    # no temporary files are left behind
+    for _, _, files in os.walk(tmp_path / 'pdbs'):
+        assert not [f for f in files if f.endswith(('.part', '.tmp'))]
+
+    # a second run finds everything in the manifest and does not download
+    # the complete entries again
+    FixtureHandler.requests = []
+    result = download(tmp_path, server, ['1err', '2abc', '4mov'])
+    assert result.returncode == 0
+    assert FixtureHandler.requests == []
+
+
+def test_missing_chain(tmp_path, server):
+    result = download(tmp_path, server, ['2abcA', '2abcB'], '--chains')
+
+    # chain A is written, the missing chain B fails the run
+    assert result.returncode != 0
+    assert '1 chains failed to extract' in result.stderr
+    assert (tmp_path / 'pdbs' / '2abcA.pdb').exists()
+    assert not (tmp_path / 'pdbs' / '2abcB.pdb').exists()
+    assert (tmp_path / 'report.tsv').read_text().startswith(
+        '2abcB\tchain\tNo chain B')
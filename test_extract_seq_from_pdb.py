@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""
+Checks that extract_seq_from_pdb.py and extract_sequences_from_pdb.py give
+the same sequence from coordinates with Bio.PDB and with the fast reader,
+for a chain with a break. Run with pytest.
+"""
+
+# imports from the standard library
+import os
+import subprocess
+import sys
+# imports from external libraries
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_chain(path, segments):
+    """
+    Writes the backbone of a chain A, without SEQRES records, as
+    (first residue ID, residue names) segments, with a break between them.
+    """
+    lines = []
+    serial = 1
+    for n, (first_id, resnames) in enumerate(segments):
+        for i, resname in enumerate(resnames):
+            x = 100.0 * n + 3.8 * i
+            for name, dx in (('N', 0.0), ('CA', 1.2), ('C', 2.47)):
+                lines.append(
+                    'ATOM  %5d  %-3s %3s A%4d    %8.3f%8.3f%8.3f  1.00'
+                    '  0.00           %s  ' % (serial, name, resname,
+                                              first_id + i, x + dx, 0.0, 0.0,
+                                              name[0]))
+                serial += 1
+    path.write_text('\n'.join(lines) + '\nTER\nEND\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('script', ['extract_seq_from_pdb.py',
+                                    'extract_sequences_from_pdb.py'])
+def test_chain_break(tmp_path, script):
+    pdb_file = write_chain(tmp_path / '1abc.pdb', [
+        (1, ['MET', 'ALA', 'LYS']), (10, ['GLY', 'TRP', 'SER'])])
+    env = dict(os.environ, PDB_CACHE_DIR='', ALIGNMENT_CACHE_DIR='')
+    sequences = []
+    for options in [], ['--fast-reader']:
+        output = str(tmp_path / 'out.fasta')
+        subprocess.run([sys.executable, os.path.join(HERE, script),
+                        '-p', pdb_file, '-c', 'A'] +
+                       (['-o', output] if script == 'extract_seq_from_pdb.py'
+                        else ['-f', output]) + options,
+                       check=True, capture_output=True, env=env)
+        with open(output, 'rt') as f:
+            sequences.append(f.read().split()[1:])
+    assert sequences == [['MAKGWS'], ['MAKGWS']]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Checks that pairwise_align.py in batch mode rejects pair lists naming
+missing records up front and leaves no half-written output when a pair
+fails. Run with pytest.
+"""
+
+# imports from external libraries
+import pytest
+# pairwise_align.py needs Biopython before 1.78, which still has Bio.Alphabet
+try:
+    import Bio.Alphabet
+except ImportError:
+    pytest.skip('Bio.Alphabet was removed from Biopython 1.78',
+                allow_module_level=True)
+# imports from this repository
+import pairwise_align
+
+
+def write_fasta(path, records):
+    """
+    Writes (ID, sequence) pairs to a fasta file.
+    """
+    path.write_text(''.join('>%s\n%s\n' % r for r in records))
+    return str(path)
+
+
+def batch(tmp_path, records_a, records_b, pairs=None):
+    """
+    Aligns the records in batch mode, returns what run_batch returns.
+    """
+    fasta_a = write_fasta(tmp_path / 'a.fasta', records_a)
+    fasta_b = write_fasta(tmp_path / 'b.fasta', records_b)
+    pair_list = None
+    if pairs is not None:
+        pair_list = tmp_path / 'pairs.txt'
+        pair_list.write_text(''.join('%s %s\n' % p for p in pairs))
+        pair_list = str(pair_list)
+    return pairwise_align.run_batch(
+        pairwise_align.read_pairs(fasta_a, fasta_b, pair_list),
+        str(tmp_path / 'out.fasta'), str(tmp_path / 'out.index'), jobs=1)
+
+
+def test_pair_list(tmp_path):
+    records_a = [('a1', 'ACDEFGHIK'), ('a2', 'LMNPQRST')]
+    records_b = [('b1', 'ACDEFGHIK'), ('b2', 'LMNPQRST')]
+    assert batch(tmp_path, records_a, records_b,
+                 [('a2', 'b2'), ('a1', 'b1')]) == (2, 0)
+    index = (tmp_path / 'out.index').read_text().splitlines()
+    assert [l.split('\t')[1:3] for l in index[1:]] == [['a2', 'b2'],
+                                                       ['a1', 'b1']]
+
+    # a missing ID is named before anything is aligned or written
+    (tmp_path / 'out.fasta').unlink()
+    (tmp_path / 'out.index').unlink()
+    with pytest.raises(ValueError, match='line 2: no record b3 in'):
+        batch(tmp_path, records_a, records_b, [('a1', 'b1'), ('a2', 'b3')])
+    assert not (tmp_path / 'out.fasta').exists()
+    assert not (tmp_path / 'out.index').exists()
+
+
+def test_empty_sequence(tmp_path):
+    assert batch(tmp_path, [('a1', 'ACDEFGHIK'), ('a2', '')],
+                 [('b1', 'ACDEFGHIK'), ('b2', 'LMN')])[0] == 2
+    output = (tmp_path / 'out.fasta').read_text().split()
+    assert output[-4:] == ['>a2', '---', '>b2', 'LMN']
+
+
+def test_failed_batch(tmp_path):
+    # the output of an earlier run stays as it was when a pair cannot be
+    # aligned
+    (tmp_path / 'out.fasta').write_text('earlier\n')
+    with pytest.raises(ValueError, match='different numbers of records'):
+        batch(tmp_path, [('a%d' % i, 'ACDEFGHIK') for i in range(40)],
+              [('b%d' % i, 'ACDEFGHIK') for i in range(39)])
+    assert (tmp_path / 'out.fasta').read_text() == 'earlier\n'
+    assert not (tmp_path / 'out.index').exists()
+    assert not list(tmp_path.glob('*.part'))
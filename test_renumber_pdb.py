@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+Checks that renumber_pdb.py renumbers every residue of a chain onto its
+target sequence, modified amino acids stored as HETATM records and residues
+with insertion codes included. Run with pytest.
+"""
+
+# imports from external libraries
+import pytest
+# renumber_pdb.py needs Biopython before 1.78, which still has Bio.Alphabet
+try:
+    import Bio.Alphabet
+except ImportError:
+    pytest.skip('Bio.Alphabet was removed from Biopython 1.78',
+                allow_module_level=True)
+# imports from this repository
+import renumber_pdb
+
+
+def atom_record(record_name, serial, name, resname, chain_id, residue_id):
+    """
+    A PDB atom record, residue_id being a residue sequence number with an
+    optional insertion code, e.g. 42 or 100A.
+    """
+    resseq = residue_id.rstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    icode = residue_id[len(resseq):] or ' '
+    return '%-6s%5d %-4s %3s %s%4d%s   %8.3f%8.3f%8.3f  1.00  0.00' \
+           '          %2s  \n' % (record_name, serial, name, resname,
+                                  chain_id, int(resseq), icode, serial,
+                                  0.0, 0.0, name[0])
+
+
+def write_chains(path, chains):
+    """
+    Writes a PDB file of chains, each given by chain ID as (record name,
+    residue name, residue ID) tuples, with an N, a CA and a C atom per
+    residue.
+    """
+    lines = []
+    for chain_id, residues in chains.items():
+        for record_name, resname, residue_id in residues:
+            for name in ('N', 'CA', 'C'):
+                lines.append(atom_record(record_name, len(lines) + 1, name,
+                                         resname, chain_id, residue_id))
+        lines.append('TER\n')
+    with open(path, 'wt') as opf:
+        opf.writelines(lines)
+
+
+def write_fasta(path, sequence):
+    with open(path, 'wt') as opf:
+        opf.write('>target\n' + sequence + '\n')
+    return str(path)
+
+
+# residue names by one-letter code
+THREE = {'A': 'ALA', 'G': 'GLY', 'M': 'MET', 'L': 'LEU', 'K': 'LYS',
+         'S': 'SER', 'V': 'VAL', 'W': 'TRP', 'Y': 'TYR', 'D': 'ASP'}
+
+# a chain with a selenomethionine, stored as HETATM records, in the middle
+MSE_CHAIN = [('ATOM', 'ALA', '11'), ('ATOM', 'GLY', '12'),
+             ('HETATM', 'MSE', '13'), ('ATOM', 'LEU', '14'),
+             ('ATOM', 'LYS', '15')]
+
+# a chain with Kabat-style insertion codes, 5A follows 5
+KABAT = [('ATOM', THREE[aa], residue_id) for aa, residue_id in zip(
+    'SVLKWAYDG', ['1', '2', '3', '4', '5', '5A', '6', '7', '8'])]
+
+
+def renumbered_ids(path, chain_id='A'):
+    """
+    Residue name and residue ID of each residue in a PDB file, in order.
+    """
+    residues = []
+    with open(path, 'rt') as ipf:
+        for l in ipf:
+            if l.startswith(('ATOM  ', 'HETATM')) and l[21] == chain_id:
+                residue = (l[17:20], l[22:27].strip())
+                if not residues or residues[-1] != residue:
+                    residues.append(residue)
+    return residues
+
+
+def renumber(pdb_file, output_file, targets):
+    sequences = renumber_pdb.read_chain_seqs(pdb_file, list(targets))
+    mappings = {c: renumber_pdb.chain_mapping(sequences[c], t)[0]
+                for c, t in targets.items()}
+    renumber_pdb.renumber_file(pdb_file, output_file, mappings)
+
+
+def test_modified_residue(tmp_path):
+    pdb_file = str(tmp_path / 'mse.pdb')
+    write_chains(pdb_file, {'A': MSE_CHAIN})
+    target = write_fasta(tmp_path / 'target.fasta', 'AGMLK')
+    assert renumber_pdb.read_chain_seqs(pdb_file, ['A'])['A'][0] == 'AGMLK'
+
+    output_file = str(tmp_path / 'renumbered.pdb')
+    renumber(pdb_file, output_file, {'A': target})
+    assert renumbered_ids(output_file) == [
+        ('ALA', '1'), ('GLY', '2'), ('MSE', '3'), ('LEU', '4'), ('LYS', '5')]
+
+
+def test_insertion_codes(tmp_path):
+    pdb_file = str(tmp_path / 'kabat.pdb')
+    write_chains(pdb_file, {'A': KABAT, 'B': KABAT})
+    target_a = write_fasta(tmp_path / 'a.fasta', 'MKKMKKMKKM' + 'SVLKWAYDG')
+    target_b = write_fasta(tmp_path / 'b.fasta', 'GG' + 'SVLKWAYDG')
+
+    output_file = str(tmp_path / 'renumbered.pdb')
+    renumber(pdb_file, output_file, {'A': target_a, 'B': target_b})
+    names = [THREE[aa] for aa in 'SVLKWAYDG']
+    assert renumbered_ids(output_file, 'A') == list(zip(
+        names, [str(i) for i in range(11, 20)]))
+    assert renumbered_ids(output_file, 'B') == list(zip(
+        names, [str(i) for i in range(3, 12)]))
+
+
+def test_batch(tmp_path):
+    mse_file = str(tmp_path / 'mse.pdb')
+    write_chains(mse_file, {'A': MSE_CHAIN})
+    kabat_file = str(tmp_path / 'kabat.pdb')
+    write_chains(kabat_file, {'A': KABAT, 'B': KABAT})
+    manifest = tmp_path / 'manifest.txt'
+    manifest.write_text('\n'.join([
+        '%s A %s' % (mse_file, write_fasta(tmp_path / 'mse.fasta', 'AGMLK')),
+        '%s A %s' % (kabat_file, write_fasta(tmp_path / 'a.fasta',
+                                             'MKKMKKMKKM' + 'SVLKWAYDG')),
+        '%s B %s' % (kabat_file, write_fasta(tmp_path / 'b.fasta',
+                                             'GG' + 'SVLKWAYDG')),
+    ]) + '\n')
+
+    output_dir = tmp_path / 'renumbered'
+    output_dir.mkdir()
+    entries = renumber_pdb.read_manifest(str(manifest), str(output_dir))
+    assert renumber_pdb.run_batch(entries, jobs=2) == (2, 0, 0)
+    assert renumbered_ids(str(output_dir / 'mse.pdb')) == [
+        ('ALA', '1'), ('GLY', '2'), ('MSE', '3'), ('LEU', '4'), ('LYS', '5')]
+    names = [THREE[aa] for aa in 'SVLKWAYDG']
+    assert renumbered_ids(str(output_dir / 'kabat.pdb'), 'A') == list(zip(
+        names, [str(i) for i in range(11, 20)]))
+    assert renumbered_ids(str(output_dir / 'kabat.pdb'), 'B') == list(zip(
+        names, [str(i) for i in range(3, 12)]))
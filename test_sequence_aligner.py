@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Checks that the banded and Hirschberg backends of sequence_aligner.py find
+alignments as good as full dynamic programming with PairwiseAligner, on
+random sequences and mutated copies of them in which a loop was replaced,
+as a PDB chain and its UniProt sequence often differ. Run with pytest.
+"""
+
+# imports from the standard library
+import random
+# imports from external libraries
+import pytest
+# imports from this repository
+import sequence_aligner
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def replace_loop(seed):
+    """
+    A random sequence and a copy of it with a loop replaced by one of
+    another length, a few substitutions and cut termini.
+    """
+    rng = random.Random(seed)
+    seq = ''.join(rng.choice(AMINO_ACIDS) for _ in range(rng.randint(300, 800)))
+    start = rng.randint(50, len(seq) - 100)
+    loop = ''.join(rng.choice(AMINO_ACIDS) for _ in range(rng.randint(0, 80)))
+    other = seq[:start] + loop + seq[start + rng.randint(5, 60):]
+    other = ''.join(rng.choice(AMINO_ACIDS) if rng.random() < 0.03 else aa
+                    for aa in other)
+    return seq, other[rng.randint(0, 20):len(other) - rng.randint(0, 20)]
+
+
+@pytest.mark.parametrize('backend', ['banded', 'hirschberg'])
+def test_optimal_score(backend):
+    aligner = sequence_aligner.get_aligner(backend)
+    reference = sequence_aligner.get_aligner('pairwise_aligner')
+    for seed in range(60 if backend == 'banded' else 10):
+        seq_a, seq_b = replace_loop(seed)
+        aligned_a, aligned_b, score = aligner.align(seq_a, seq_b)
+        assert aligned_a.replace('-', '') == seq_a
+        assert aligned_b.replace('-', '') == seq_b
+        assert sequence_aligner.score_alignment(aligned_a, aligned_b) == score
+        assert score == reference.score(seq_a, seq_b), seed
+
+
+def test_overflow_fallback():
+    # around these repeats the best path avoids the split point at (27, 25),
+    # the pieces on either side of it align to 8.5 instead of 11.5
+    seq_a = 'AAACDDCCCCADCDACAACADCCCCCAAADCDACCDADAAACDA'
+    seq_b = 'CDDCCCCADCDADCAACADCCCCCAAADCDACDADAAACDD'
+    aligner = sequence_aligner.BandedBackend(k=4, step=8)
+    reference = sequence_aligner.get_aligner('pairwise_aligner')
+    splits = aligner.split_points(seq_a, seq_b)
+    assert splits == [(0, 0), (27, 25), (44, 41)]
+    parts = [aligner.full(seq_a[i1:i2], seq_b[j1:j2])
+             for (i1, j1), (i2, j2) in zip(splits, splits[1:])]
+    assert sequence_aligner.score_alignment(
+        parts[0][0] + parts[1][0], parts[0][1] + parts[1][1]) == 8.5
+    assert aligner.overflows(seq_a, seq_b, splits, parts)
+    assert aligner.align(seq_a, seq_b)[2] == reference.score(seq_a, seq_b)
+
+
+@pytest.mark.parametrize('backend', ['pairwise_aligner', 'banded',
+                                     'hirschberg'])
+def test_empty_sequence(backend):
+    aligner = sequence_aligner.get_aligner(backend)
+    assert aligner.align('', 'ACD') == ('---', 'ACD', -10)
+    assert aligner.align('ACD', '') == ('ACD', '---', -10)
+    assert aligner.score('', 'ACD') == -10
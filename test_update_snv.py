@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""
+Checks that update_snv.py parses and renumbers SNVs with the position in
+either column, signed positions included. Run with pytest.
+"""
+
+# imports from external libraries
+import numpy as np
+import pytest
+# update_snv.py needs Biopython before 1.78, which still has Bio.Alphabet
+try:
+    import Bio.Alphabet
+except ImportError:
+    pytest.skip('Bio.Alphabet was removed from Biopython 1.78',
+                allow_module_level=True)
+# imports from this repository
+import update_snv
+from residue_mapping import create_id_mapping
+
+
+def test_from_lines():
+    snvs = update_snv.SNVs.from_lines([
+        'P12345 3 A G', 'P12345,K,4,R', 'P12345 -2 A G', 'P12345:M:+1:V'])
+    assert snvs.position.tolist() == [3, 4, -2, 1]
+    assert snvs.wild_type.tolist() == ['A', 'K', 'A', 'M']
+    assert snvs.variant.tolist() == ['G', 'R', 'G', 'V']
+
+
+def test_renumber():
+    new_positions = create_id_mapping('MAKL-', '-AKLW')[0]
+    new_sequence = np.array(list('AKLW'), dtype='U1')
+    snvs = update_snv.SNVs.from_lines([
+        'P12345 M 1 V', 'P12345 A 2 G', 'P12345 K 3 R', 'P12345 A 4 G',
+        'P12345 A -2 G', 'P12345 A 9 G'])
+    translated, unmapped, mismatch = update_snv.renumber(
+        snvs, new_positions, new_sequence)
+    assert unmapped.tolist() == [True, False, False, False, True, True]
+    assert mismatch.tolist() == [False, False, False, True, False, False]
+    assert translated[~unmapped].tolist() == [1, 2, 3]
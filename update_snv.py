@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 
+import os
 from argparse import ArgumentParser
+from itertools import islice
+import numpy as np
 from Bio import SeqIO
 from Bio.Alphabet import IUPAC
+from residue_mapping import create_id_mapping, UNMAPPED
+
+# number of SNVs read, renumbered and written at a time; each is held as a
+# list of Python strs while its chunk is parsed, about 300 bytes apiece
+CHUNK_SIZE = 2**16
 
 
 class SNV:
@@ -102,6 +110,103 @@ class SNV:
         )
 
 
+class SNVs:
+    """
+    Structure-of-arrays view of many single nucleotide variants: uniprot,
+    position, wild_type and variant each hold one array entry per SNV.
+    """
+    __slots__ = ('uniprot', 'position', 'wild_type', 'variant')
+
+    def __init__(self, uniprot, position, wild_type, variant):
+        self.uniprot = np.asarray(uniprot, dtype='U')
+        self.position = np.asarray(position, dtype='int64')
+        self.wild_type = np.asarray(wild_type, dtype='U')
+        self.variant = np.asarray(variant, dtype='U')
+
+    def __len__(self):
+        return len(self.position)
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Parses SNVs given one per line as in SNV.create_snv: a UniProt
+        accession, the position and the wild-type residue in either order,
+        and the variant residue, separated by spaces, commas or colons.
+        """
+        rows = [l.replace(',', ' ').replace(':', ' ').split() for l in lines]
+        for fields in rows:
+            if len(fields) != 4:
+                raise ValueError('Invalid number of fields in ' +
+                                 ' '.join(fields) + '. Expected 4 fields.')
+        fields = np.array(rows, dtype='U').reshape(len(rows), 4)
+        # the position comes either second or third, possibly with a sign
+        second = np.char.isdigit(np.char.lstrip(fields[:, 1], '+-'))
+        return cls(fields[:, 0],
+                   np.where(second, fields[:, 1], fields[:, 2]).astype('int64'),
+                   np.where(second, fields[:, 2], fields[:, 1]), fields[:, 3])
+
+    def select(self, mask):
+        """
+        A new SNVs holding only the SNVs selected by the given boolean mask
+        or index array.
+        """
+        return SNVs(self.uniprot[mask], self.position[mask],
+                    self.wild_type[mask], self.variant[mask])
+
+    def format(self):
+        """
+        The SNVs as text, one per line in the form SNV.__str__ gives.
+        """
+        return ''.join('%s %d %s %s\n' % snv for snv in zip(
+            self.uniprot.tolist(), self.position.tolist(),
+            self.wild_type.tolist(), self.variant.tolist()))
+
+
+def renumber(snvs, new_positions, new_sequence):
+    """
+    Positions of SNVs in a new sequence.
+
+    Parameters
+    ----------
+    snvs : SNVs
+        SNVs numbered by their positions in the old sequence.
+    new_positions : numpy.ndarray
+        Position in the new sequence of each position in the old sequence,
+        UNMAPPED for those aligned with a gap, as given by create_id_mapping.
+    new_sequence : numpy.ndarray
+        One-letter codes of the new sequence.
+
+    Returns
+    -------
+    tuple
+        The new position of each SNV, a mask of the SNVs that have no
+        counterpart in the new sequence and a mask of those whose wild-type
+        residue does not match the residue at their new position.
+    """
+    position = snvs.position
+    in_old = (position >= 1) & (position <= len(new_positions))
+    translated = np.full(len(snvs), UNMAPPED, dtype='int64')
+    translated[in_old] = new_positions[position[in_old] - 1]
+    unmapped = translated == UNMAPPED
+    mismatch = ~unmapped
+    mismatch[~unmapped] = new_sequence[translated[~unmapped] - 1] != \
+        snvs.wild_type[~unmapped]
+    return translated, unmapped, mismatch
+
+
+def read_chunks(infile, chunk_size=CHUNK_SIZE):
+    """
+    Yields SNVs parsed from a file, chunk_size at a time, skipping blank
+    lines and comments.
+    """
+    lines = (l for l in infile if l.strip() and not l.strip().startswith('#'))
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield SNVs.from_lines(chunk)
+
+
 def parse_cmd_arguments():
     # setting up
     parser = ArgumentParser()
@@ -115,6 +220,9 @@ def parse_cmd_arguments():
                         required=True, help='Sequence alignment in FASTA '
                         'format. The old sequence must be the first '
                         'sequence record in the FASTA file.')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+                        default=CHUNK_SIZE, help='Number of SNVs to renumber '
+                        'at a time, default %d.' % CHUNK_SIZE)
     # do any checking on command-line arguments here, if necessary
     return parser.parse_args()
 
@@ -131,41 +239,37 @@ def main():
         raise SystemExit('There must be two and only two sequence records in '
                          'the FASTA file: ' + args.input)
 
-    # create a list of SNVs from the given file
-    with open(args.input, 'rt') as infile:
-        snvs = [SNV.create_snv(l.replace(',', ' ').replace(':', ' ')) for l
-                in infile if not l.strip().startswith('#')]
-
-    # get all the positions where gaps were inserted
-    non_gap_indices = [i for i, a in enumerate(records[0].seq) if a != '-']
-
-    # update SNV numbering
-    updated_snvs = list()
-    for snv in snvs:
-        # add SNVs that do not need numbering updated
-        if snv.wild_type == records[1].seq[snv.position - 1]:
-            updated_snvs.append(snv)
-            continue
-        # update numbering
-        offset = non_gap_indices[0]
-        new_position = snv.position + offset
-        # make sure that the amino acid at the new position in the other
-        # sequence matches the wild-type amino acid
-        if snv.wild_type != records[1].seq[new_position - 1]:
-            print('In %s: wild-type residue in the SNV does not match that '
-                  'in the new sequence: %s vs %s at %d, skip to the next SNV.' 
-                  % (args.input, snv.wild_type, records[1].seq[new_position - 1], new_position))
-            continue
-        snv.position = new_position
-        updated_snvs.append(snv)
-
-    if not updated_snvs:
+    # position in the new sequence of each position in the old sequence
+    new_positions = create_id_mapping(records[0].seq, records[1].seq)[0]
+    new_sequence = np.array(list(str(records[1].seq).replace('-', '')),
+                            dtype='U1')
+
+    # update SNV numbering chunk by chunk, writing each chunk as it is done
+    num_written = 0
+    with open(args.input, 'rt') as infile, \
+            open(args.output, 'wt') as outfile:
+        for snvs in read_chunks(infile, args.chunk_size):
+            translated, unmapped, mismatch = renumber(snvs, new_positions,
+                                                      new_sequence)
+            for i in np.flatnonzero(unmapped | mismatch):
+                if unmapped[i]:
+                    print('In %s: position %d has no counterpart in the new '
+                          'sequence, skip to the next SNV.' % (
+                              args.input, snvs.position[i]))
+                else:
+                    print('In %s: wild-type residue in the SNV does not '
+                          'match that in the new sequence: %s vs %s at %d, '
+                          'skip to the next SNV.' % (
+                              args.input, snvs.wild_type[i],
+                              new_sequence[translated[i] - 1], translated[i]))
+            keep = ~(unmapped | mismatch)
+            snvs.position = translated
+            outfile.write(snvs.select(keep).format())
+            num_written += keep.sum()
+
+    if not num_written:
+        os.remove(args.output)
         raise SystemExit('No valid variant was found in %s.' % args.input)
-    else:
-        with open(args.output, 'wt') as outfile:
-            outfile.write('\n'.join([str(v) for v in updated_snvs]))
-            # append a newline character
-            outfile.write('\n')
 
 
 if __name__ == '__main__':